@@ -1,11 +1,9 @@
 """Coffee making endpoints for v1 API."""
 from fastapi import APIRouter, Depends, status
-from starlette.requests import Request
 
 from app.models import CoffeeType, MessageResponse
 from app.services import CoffeeMachineService
 from app.dependencies import get_service
-from app.rate_limiter import limiter
 
 router = APIRouter()
 
@@ -23,15 +21,10 @@ router = APIRouter()
         },
         409: {
             "description": "Insufficient resources to make espresso",
-        },
-        429: {
-            "description": "Rate limit exceeded",
         }
     }
 )
-@limiter.limit("20/minute")
 async def make_espresso(
-    request: Request,
     service: CoffeeMachineService = Depends(get_service)
 ):
     """
@@ -63,15 +56,10 @@ async def make_espresso(
         },
         409: {
             "description": "Insufficient resources to make double espresso",
-        },
-        429: {
-            "description": "Rate limit exceeded",
         }
     }
 )
-@limiter.limit("20/minute")
 async def make_double_espresso(
-    request: Request,
     service: CoffeeMachineService = Depends(get_service)
 ):
     """
@@ -101,15 +89,10 @@ async def make_double_espresso(
         },
         409: {
             "description": "Insufficient resources to make ristretto",
-        },
-        429: {
-            "description": "Rate limit exceeded",
         }
     }
 )
-@limiter.limit("20/minute")
 async def make_ristretto(
-    request: Request,
     service: CoffeeMachineService = Depends(get_service)
 ):
     """
@@ -143,15 +126,10 @@ async def make_ristretto(
         },
         409: {
             "description": "Insufficient resources to make americano",
-        },
-        429: {
-            "description": "Rate limit exceeded",
         }
     }
 )
-@limiter.limit("20/minute")
 async def make_americano(
-    request: Request,
     service: CoffeeMachineService = Depends(get_service)
 ):
     """
@@ -1,18 +1,26 @@
 """Health check endpoints for v1 API."""
-from fastapi import APIRouter, Depends
-from starlette.responses import JSONResponse
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, Request, status
+from starlette.responses import Response
+import orjson
 from datetime import datetime
 
-router = APIRouter()
-
-# Global health checker instance (set during startup)
-_health_checker = None
+from app.dependencies import get_health_checker
+from app.health import HealthChecker
 
+router = APIRouter()
 
-def set_health_checker(checker):
-    """Set the global health checker instance."""
-    global _health_checker
-    _health_checker = checker
+# Static probe bodies, encoded once and returned as-is
+_LIVE_RESPONSE = Response(
+    content=b'{"status":"alive"}',
+    media_type="application/json",
+    headers={"Cache-Control": "no-store"},
+)
+_READY_RESPONSE = Response(
+    content=b'{"status":"ready"}',
+    media_type="application/json",
+    headers={"Cache-Control": "no-store"},
+)
 
 
 @router.get(
@@ -23,10 +31,17 @@ def set_health_checker(checker):
     responses={
         200: {
             "description": "Detailed health status",
+        },
+        304: {
+            "description": "Status and checks unchanged since the ETag sent in If-None-Match",
         }
     }
 )
-async def health_check():
+async def health_check(
+    request: Request,
+    response: Response,
+    health_checker: Optional[HealthChecker] = Depends(get_health_checker)
+) -> Dict[str, Any]:
     """
     Comprehensive health check endpoint.
     
@@ -36,11 +51,19 @@ async def health_check():
     - Machine state (container levels, warnings)
     
     Overall status can be: healthy, degraded, or unhealthy
+    
+    Responses carry a weak `ETag` over the status and checks; sending it back
+    in `If-None-Match` returns `304 Not Modified` while they are unchanged.
     """
-    if _health_checker is None:
+    if health_checker is None:
         return {"status": "unknown", "message": "Health checker not initialized"}
     
-    return await _health_checker.check_health()
+    health = await health_checker.check_health()
+    etag = health_checker.etag
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return health
 
 
 @router.get(
@@ -54,7 +77,7 @@ async def liveness_probe():
     Kubernetes-style liveness probe.
     Returns 200 if server is running.
     """
-    return {"status": "alive"}
+    return _LIVE_RESPONSE
 
 
 @router.get(
@@ -63,25 +86,29 @@ async def liveness_probe():
     summary="Readiness Probe",
     description="Kubernetes-style readiness probe. Returns 200 if server is ready to accept traffic.",
 )
-async def readiness_probe():
+async def readiness_probe(
+    health_checker: Optional[HealthChecker] = Depends(get_health_checker)
+):
     """
     Kubernetes-style readiness probe.
     Returns 200 if server is ready to accept traffic.
     Returns 503 if server is not ready.
     """
-    if _health_checker is None:
-        return JSONResponse(
+    if health_checker is None:
+        return Response(
+            content=b'{"status":"not_ready","message":"Health checker not initialized"}',
             status_code=503,
-            content={"status": "not_ready", "message": "Health checker not initialized"}
+            media_type="application/json"
         )
     
-    health = await _health_checker.check_health()
+    health = await health_checker.check_health()
     
     if health["status"] == "unhealthy":
-        return JSONResponse(
+        return Response(
+            content=orjson.dumps(health),
             status_code=503,
-            content=health
+            media_type="application/json"
         )
     
-    return {"status": "ready"}
+    return _READY_RESPONSE
 
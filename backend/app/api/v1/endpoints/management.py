@@ -1,35 +1,36 @@
 """Machine management endpoints for v1 API."""
-from fastapi import APIRouter, Depends, status
-from starlette.requests import Request
-from typing import Optional
+from fastapi import APIRouter, Depends, Request, Response, status
+from typing import Any, Dict, Optional
 
-from app.models import FillRequest, MessageResponse, StatusResponse
+from app.models import FillRequest, FillResponse, MessageResponse, StatusResponse
 from app.services import CoffeeMachineService
-from app.dependencies import get_service
-from app.config import get_settings
-from app.rate_limiter import limiter
+from app.dependencies import get_service, get_runtime_config
+from app.config import RuntimeConfig
 
+# Routes are grouped by rate limit bucket; limits are attached in app.api.v1.router
 router = APIRouter()
+status_router = APIRouter()
+fill_router = APIRouter()
 
 
-@router.get(
+@status_router.get(
     "/status",
-    response_model=StatusResponse,
     tags=["Machine Management"],
     summary="Get Machine Status",
     description="Retrieve the current status of the coffee machine including container levels and statistics. Rate limit: 60/minute",
     responses={
         200: {
+            "model": StatusResponse,
             "description": "Machine status retrieved successfully",
         },
-        429: {
-            "description": "Rate limit exceeded",
+        304: {
+            "description": "Status unchanged since the ETag sent in If-None-Match",
         }
     }
 )
-@limiter.limit("60/minute")
 async def get_status(
     request: Request,
+    response: Response,
     service: CoffeeMachineService = Depends(get_service)
 ):
     """
@@ -42,13 +43,20 @@ async def get_status(
     - Total number of coffees made
     
     Response includes all data needed for displaying machine status in the UI.
+    The body is served pre-serialized with an `ETag`; clients sending it back in
+    `If-None-Match` get `304 Not Modified` while the status is unchanged.
     """
-    return service.get_status()
+    body, etag = service.get_status_json()
+    # Returning a Response skips FastAPI's merge of dependency headers (rate limits)
+    headers = {**response.headers, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
-@router.post(
+@fill_router.post(
     "/fill/water",
-    response_model=MessageResponse,
+    response_model=FillResponse,
     tags=["Machine Management"],
     summary="Fill Water Container",
     description="Add water to the water container. The amount is added to the current level. Rate limit: 30/minute",
@@ -62,15 +70,10 @@ async def get_status(
         },
         422: {
             "description": "Invalid amount (must be positive)",
-        },
-        429: {
-            "description": "Rate limit exceeded",
         }
     }
 )
-@limiter.limit("30/minute")
 async def fill_water(
-    request: Request,
     fill_request: FillRequest,
     service: CoffeeMachineService = Depends(get_service)
 ):
@@ -91,14 +94,14 @@ async def fill_water(
     - The amount is not positive (422 error)
     - Adding the amount would exceed the container capacity (409 error)
     
-    Returns a message indicating the new water level.
+    Returns the amount added and the new water level and capacity.
 """
     return service.fill_water(fill_request.amount)
 
 
-@router.post(
+@fill_router.post(
     "/fill/coffee",
-    response_model=MessageResponse,
+    response_model=FillResponse,
     tags=["Machine Management"],
     summary="Fill Coffee Container",
     description="Add coffee to the coffee container. The amount is added to the current level. Rate limit: 30/minute",
@@ -112,15 +115,10 @@ async def fill_water(
         },
         422: {
             "description": "Invalid amount (must be positive)",
-        },
-        429: {
-            "description": "Rate limit exceeded",
         }
     }
 )
-@limiter.limit("30/minute")
 async def fill_coffee(
-    request: Request,
     fill_request: FillRequest,
     service: CoffeeMachineService = Depends(get_service)
 ):
@@ -141,7 +139,7 @@ async def fill_coffee(
     - The amount is not positive (422 error)
     - Adding the amount would exceed the container capacity (409 error)
     
-    Returns a message indicating the new coffee level.
+    Returns the amount added and the new coffee level and capacity.
     """
     return service.fill_coffee(fill_request.amount)
 
@@ -168,7 +166,7 @@ async def reset_machine(service: CoffeeMachineService = Depends(get_service)):
     - Empties the coffee container (sets to 0g)
     - Resets the total coffees made counter to 0
     
-    Useful for testing or starting fresh. The reset state is persisted immediately.
+    Useful for testing or starting fresh. The reset state is saved right away by the background save worker.
     
     **Warning:** This operation cannot be undone. All state is permanently lost.
     """
@@ -176,7 +174,9 @@ async def reset_machine(service: CoffeeMachineService = Depends(get_service)):
 
 
 @router.get("/config/containers")
-async def get_container_config():
+async def get_container_config(
+    runtime: RuntimeConfig = Depends(get_runtime_config)
+) -> Dict[str, Any]:
     """
     Get current container configuration.
     
@@ -185,13 +185,5 @@ async def get_container_config():
         - Custom capacities (if set via environment variables)
         - Effective capacities (custom or default)
     """
-    settings = get_settings()
-    return {
-        "default_water_capacity": settings.water_capacity,
-        "default_coffee_capacity": settings.coffee_capacity,
-        "custom_water_capacity": settings.custom_water_capacity,
-        "custom_coffee_capacity": settings.custom_coffee_capacity,
-        "effective_water_capacity": settings.effective_water_capacity,
-        "effective_coffee_capacity": settings.effective_coffee_capacity,
-    }
+    return runtime.container_config
 
@@ -1,23 +1,34 @@
 """WebSocket endpoints for real-time updates."""
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, WebSocketException, status
-from app.websocket_manager import manager
+import orjson
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, WebSocketException, status
+from starlette.responses import Response
+from app.websocket_manager import manager, PING_FRAME, PONG_FRAME
 from app.services import CoffeeMachineService
-from app.dependencies import get_service
+from app.dependencies import get_service, get_runtime_config
 from app.logger import logger
-from app.config import get_settings
-from datetime import datetime
+from app.config import RuntimeConfig
 
 router = APIRouter()
 
+_EMPTY_STATS_RESPONSE = Response(
+    content=b'{"total_connections":0,"connections":[]}',
+    media_type="application/json",
+)
+
 
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
-    client_id: str = None
+    client_id: str = None,
+    service: CoffeeMachineService = Depends(get_service),
+    runtime: RuntimeConfig = Depends(get_runtime_config)
 ):
     """
     WebSocket endpoint for real-time updates.
     
+    Messages are JSON documents delivered as binary frames. Clients send a
+    single 0x01 byte as heartbeat and receive a pong frame in reply.
+    
     Clients will receive:
     - status_update: When machine status changes
     - coffee_made: When coffee is made
@@ -27,14 +38,12 @@ async def websocket_endpoint(
     Args:
         websocket: WebSocket connection
         client_id: Optional client identifier
+        service: Coffee machine service
+        runtime: Settings snapshot (allowed origins)
     """
     # Validate origin for WebSocket (FastAPI doesn't automatically validate WebSocket origins)
     origin = websocket.headers.get("origin")
-    settings = get_settings()
-    allowed_origins = settings.cors_origins.split(",") if "," in settings.cors_origins else [settings.cors_origins]
-    allowed_origins = [o.strip() for o in allowed_origins]
-    
-    if origin and origin not in allowed_origins and "*" not in allowed_origins:
+    if origin and not runtime.cors_allow_all and origin not in runtime.cors_origins_set:
         logger.warning(f"WebSocket connection rejected: origin {origin} not in allowed origins")
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
@@ -44,13 +53,12 @@ async def websocket_endpoint(
 
     # Safe status push: try and log error if it fails
     try:
-        service = get_service()
         status = service.get_status()
         await manager.send_personal_message(
             {
                 "type": "status_update",
                 "data": status["data"],
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": websocket.app.state.now_iso,
             },
             websocket,
         )
@@ -59,15 +67,15 @@ async def websocket_endpoint(
     
     try:
         while True:
-            # Wait for messages from client
-            data = await websocket.receive_text()
+            # Wait for messages from client (binary or text frames)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            data = message.get("bytes") or message.get("text")
             
             # Handle different message types from client
-            if data == "ping":
-                await manager.send_personal_message(
-                    {"type": "pong", "timestamp": datetime.now().isoformat()},
-                    websocket
-                )
+            if data == PING_FRAME or data == "ping":
+                await manager.send_frame(PONG_FRAME, websocket)
             elif data == "request_status":
                 # Client requesting current status
                 # Note: This would need proper dependency injection
@@ -84,12 +92,14 @@ async def websocket_endpoint(
 
 
 @router.get("/ws/stats")
-async def get_websocket_stats():
+async def get_websocket_stats() -> Response:
     """
     Get WebSocket connection statistics.
     
     Returns:
         Dictionary with active connections and statistics
     """
-    return manager.get_stats()
+    if not manager.connection_metadata:
+        return _EMPTY_STATS_RESPONSE
+    return Response(content=orjson.dumps(manager.get_stats()), media_type="application/json")
 
@@ -1,17 +1,37 @@
 """Main router for v1 API that combines all endpoint routers."""
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from app.api.v1.endpoints import coffee, management, health, websocket
+from app.rate_limiter import assign_route_ids, rate_limit
 
 api_router = APIRouter()
 
+# OpenAPI entry shared by every rate limited route
+RATE_LIMITED_RESPONSES = {429: {"description": "Rate limit exceeded"}}
+
 # Include coffee endpoints
 api_router.include_router(
     coffee.router,
     prefix="/coffee",
-    tags=["Coffee Making"]
+    tags=["Coffee Making"],
+    dependencies=[Depends(rate_limit(20, 60))],
+    responses=RATE_LIMITED_RESPONSES
 )
 
 # Include management endpoints
+api_router.include_router(
+    management.status_router,
+    prefix="",
+    tags=["Machine Management"],
+    dependencies=[Depends(rate_limit(60, 60))],
+    responses=RATE_LIMITED_RESPONSES
+)
+api_router.include_router(
+    management.fill_router,
+    prefix="",
+    tags=["Machine Management"],
+    dependencies=[Depends(rate_limit(30, 60))],
+    responses=RATE_LIMITED_RESPONSES
+)
 api_router.include_router(
     management.router,
     prefix="",
@@ -32,3 +52,5 @@ api_router.include_router(
     tags=["WebSocket"]
 )
 
+# Give every rate limited endpoint a compact id for its rate limit keys
+assign_route_ids(coffee.router, management.status_router, management.fill_router)
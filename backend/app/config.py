@@ -1,6 +1,7 @@
 """Configuration management for the coffee machine application."""
-from functools import lru_cache
-from typing import Optional
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from typing import Any, Dict, FrozenSet, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -26,6 +27,20 @@ class Settings(BaseSettings):
     # Rate limiting
     rate_limit_enabled: bool = True
     rate_limit_storage: str = "memory://"
+    # Fraction of each limit admitted in-process before Redis is consulted; each
+    # worker admits that much on its own, so keep ratio * workers <= 1 (0 disables)
+    rate_limit_prefilter_ratio: float = 0.0
+    
+    # Persistence (seconds state changes are coalesced before being saved)
+    state_save_interval: float = 1.0
+    # Write the state file via fsynced temp file + atomic rename; disable only for dev/test
+    durable_writes: bool = True
+    # Indent the state file for reading by hand (dev); compact otherwise
+    pretty_json: bool = False
+    
+    # Health checks (seconds a probe result is reused, per-check time budget)
+    health_probe_interval: float = 5.0
+    health_check_timeout: float = 2.0
     
     # API configuration
     api_title: str = "Coffee Machine API"
@@ -45,9 +60,43 @@ class Settings(BaseSettings):
     def effective_coffee_capacity(self) -> float:
         """Return custom or default coffee capacity."""
         return self.custom_coffee_capacity if self.custom_coffee_capacity is not None else self.coffee_capacity
+    
+    @cached_property
+    def cors_origins_set(self) -> FrozenSet[str]:
+        """Return configured CORS origins, parsed once."""
+        return frozenset(o.strip() for o in self.cors_origins.split(",") if o.strip())
+    
+    @cached_property
+    def cors_allow_all(self) -> bool:
+        """Return whether the ``*`` wildcard allows any origin."""
+        return "*" in self.cors_origins_set
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeConfig:
+    """Immutable snapshot of the settings read on request hot paths."""
+    cors_origins_set: FrozenSet[str]
+    cors_allow_all: bool
+    container_config: Dict[str, Any]
+    
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RuntimeConfig":
+        """Build the snapshot from loaded settings."""
+        return cls(
+            cors_origins_set=settings.cors_origins_set,
+            cors_allow_all=settings.cors_allow_all,
+            container_config={
+                "default_water_capacity": settings.water_capacity,
+                "default_coffee_capacity": settings.coffee_capacity,
+                "custom_water_capacity": settings.custom_water_capacity,
+                "custom_coffee_capacity": settings.custom_coffee_capacity,
+                "effective_water_capacity": settings.effective_water_capacity,
+                "effective_coffee_capacity": settings.effective_coffee_capacity,
+            },
+        )
 
 
-@lru_cache()
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     """Get cached settings instance (singleton pattern)."""
     return Settings()
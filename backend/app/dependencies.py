@@ -1,24 +1,21 @@
 """FastAPI dependencies for dependency injection."""
+from typing import Optional
+from starlette.requests import HTTPConnection
+from app.config import RuntimeConfig
 from app.services import CoffeeMachineService
-from app.config import get_settings
-from app.storage import get_storage
+from app.health import HealthChecker
 
-# Global service instance (set in main.py during startup)
-_service_instance: CoffeeMachineService = None
 
+def get_service(request: HTTPConnection) -> CoffeeMachineService:
+    """Dependency to get the coffee machine service created at startup."""
+    return request.app.state.service
 
-def set_service_instance(service: CoffeeMachineService) -> None:
-    """Set the global service instance."""
-    global _service_instance
-    _service_instance = service
 
+def get_health_checker(request: HTTPConnection) -> Optional[HealthChecker]:
+    """Dependency to get the health checker, or None before startup."""
+    return getattr(request.app.state, "health", None)
 
-def get_service() -> CoffeeMachineService:
-    """Dependency to get coffee machine service."""
-    if _service_instance is None:
-        # Fallback: create service if not initialized
-        settings = get_settings()
-        storage = get_storage(settings.storage_type, file_path=settings.data_path)
-        return CoffeeMachineService(storage)
-    return _service_instance
 
+def get_runtime_config(request: HTTPConnection) -> RuntimeConfig:
+    """Dependency to get the settings snapshot taken at startup."""
+    return request.app.state.runtime
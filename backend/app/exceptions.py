@@ -1,7 +1,8 @@
 """Custom exceptions for the coffee machine."""
 from fastapi import HTTPException, Request
-from fastapi.responses import JSONResponse
-from typing import Dict, Any
+from fastapi.responses import Response
+from typing import Dict, Any, Optional
+import orjson
 
 
 class CoffeeMachineException(Exception):
@@ -16,6 +17,11 @@ class CoffeeMachineException(Exception):
         """Default HTTP status code."""
         return 500
     
+    @property
+    def headers(self) -> Optional[Dict[str, str]]:
+        """Extra HTTP headers to send with the error response."""
+        return None
+    
     def to_dict(self) -> Dict[str, Any]:
         """Convert exception to dictionary for API responses."""
         return {
@@ -118,10 +124,49 @@ class InvalidAmountException(CoffeeMachineException):
         return base_dict
 
 
-def exception_handler(request: Request, exc: CoffeeMachineException) -> JSONResponse:
+class RateLimitExceededException(CoffeeMachineException):
+    """Raised when a client exceeds the rate limit for an endpoint."""
+    
+    def __init__(
+        self,
+        limit: int,
+        window_seconds: int,
+        retry_after: int,
+        rate_limit_headers: Optional[Dict[str, str]] = None
+    ):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.retry_after = retry_after
+        self.rate_limit_headers = rate_limit_headers or {}
+        super().__init__("Rate limit exceeded. Please try again later.")
+    
+    @property
+    def status_code(self) -> int:
+        """HTTP status code for too many requests."""
+        return 429
+    
+    @property
+    def headers(self) -> Optional[Dict[str, str]]:
+        """Rate limit headers plus Retry-After."""
+        return {**self.rate_limit_headers, "Retry-After": str(self.retry_after)}
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary with rate limit details."""
+        base_dict = super().to_dict()
+        base_dict["details"] = {
+            "limit": self.limit,
+            "window_seconds": self.window_seconds,
+            "retry_after": self.retry_after
+        }
+        return base_dict
+
+
+def exception_handler(request: Request, exc: CoffeeMachineException) -> Response:
     """Convert custom exceptions to JSON responses."""
-    return JSONResponse(
+    return Response(
+        content=orjson.dumps(exc.to_dict()),
         status_code=exc.status_code,
-        content=exc.to_dict()
+        media_type="application/json",
+        headers=exc.headers
     )
 
@@ -1,77 +1,207 @@
 """Health check functionality for the coffee machine."""
-from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+import orjson
+import psutil
+from app.models import MachineState
+from app.services import CoffeeMachineService
 from app.storage import StorageInterface
 from app.logger import logger
-from app.dependencies import get_service
+
+# Latest system-wide CPU usage, refreshed in the background by sample_cpu()
+_last_cpu_percent: Optional[float] = None
+
+
+async def sample_cpu(interval: float = 5.0) -> None:
+    """
+    Sample CPU usage every interval seconds for the system health check.
+    
+    Runs for the lifetime of the application so health checks can read the
+    latest value instead of blocking on a measurement window.
+    
+    Args:
+        interval: Seconds between samples
+    """
+    global _last_cpu_percent
+    # The first non-blocking call only arms the measurement
+    psutil.cpu_percent(interval=None)
+    while True:
+        await asyncio.sleep(interval)
+        _last_cpu_percent = psutil.cpu_percent(interval=None)
+
+
+# Severity of each check status; the overall status is the most severe one
+_SEVERITY = {"healthy": 0, "unknown": 1, "degraded": 1, "unhealthy": 2}
+_STATUS_BY_SEVERITY = ("healthy", "degraded", "unhealthy")
+
+# Memory and disk usage move slowly, so readings are reused for this many seconds
+SYSTEM_READINGS_TTL = 2.0
+_system_readings: Optional[Tuple[float, Any, Any]] = None
+
+
+def _read_memory_and_disk() -> Tuple[Any, Any]:
+    """Return (virtual_memory, disk_usage) readings, refreshed at most every SYSTEM_READINGS_TTL."""
+    global _system_readings
+    now = time.monotonic()
+    if _system_readings is None or now - _system_readings[0] >= SYSTEM_READINGS_TTL:
+        _system_readings = (now, psutil.virtual_memory(), psutil.disk_usage('/'))
+    return _system_readings[1], _system_readings[2]
 
 
 class HealthChecker:
     """Comprehensive health checker for the coffee machine system."""
     
-    def __init__(self, storage: StorageInterface):
-        """Initialize health checker with storage backend."""
+    def __init__(
+        self,
+        storage: StorageInterface,
+        probe_interval: float = 5.0,
+        check_timeout: float = 2.0,
+        service: Optional[CoffeeMachineService] = None
+    ):
+        """
+        Initialize health checker with storage backend.
+        
+        Args:
+            storage: Storage backend to probe
+            probe_interval: Seconds a health result is reused before probing again
+            check_timeout: Seconds each individual check may take
+            service: Service whose in-memory state the machine check reads; the
+                saved state can lag it by up to the save interval. Without a
+                service the machine check uses the state loaded from storage
+        """
         self.storage = storage
-        self.start_time = datetime.now()
-        self._service = None
+        self.probe_interval = probe_interval
+        self.check_timeout = check_timeout
+        self.start_time = time.monotonic()
+        self._service = service
+        self._cached_health: Optional[Dict[str, Any]] = None
+        self._cached_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        # Weak validator for the latest result, over its status and checks only
+        self.etag: Optional[str] = None
     
     async def check_health(self) -> Dict[str, Any]:
         """
         Perform comprehensive health check.
         
+        Probes run at most once per probe_interval; calls in between return
+        the last result with a fresh timestamp and ``cached: true``. Concurrent
+        callers share a single refresh. The probes block on disk and psutil,
+        so each runs in a worker thread to keep the event loop responsive.
+        
         Returns:
             Dictionary with overall status and individual check results
         """
+        cached = self._get_cached()
+        if cached is not None:
+            return cached
+        
+        async with self._refresh_lock:
+            # Another caller may have refreshed while we waited for the lock
+            cached = self._get_cached()
+            if cached is not None:
+                return cached
+            
+            health_status = await self._run_checks()
+            self._cached_health = health_status
+            self._cached_at = time.monotonic()
+            digest = hashlib.blake2b(
+                orjson.dumps([health_status["status"], health_status["checks"]]),
+                digest_size=8
+            ).hexdigest()
+            self.etag = f'W/"{digest}"'
+            return health_status
+    
+    def _get_cached(self) -> Optional[Dict[str, Any]]:
+        """Return a copy of the last result if it is still within probe_interval."""
+        if self._cached_health is None or time.monotonic() - self._cached_at >= self.probe_interval:
+            return None
+        return {**self._cached_health, "timestamp": datetime.now(timezone.utc).isoformat(), "cached": True}
+    
+    async def _run_checks(self) -> Dict[str, Any]:
+        """Run all checks concurrently and compute the overall status."""
         health_status = {
             "status": "healthy",
-            "timestamp": datetime.now().isoformat(),
-            "uptime": str(datetime.now() - self.start_time),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "uptime": f"{time.monotonic() - self.start_time:.1f}s",
+            "cached": False,
             "checks": {}
         }
         
-        # Check storage
-        storage_check = await self._check_storage()
-        health_status["checks"]["storage"] = storage_check
+        # Loading state and reading system resources block independently, so
+        # they run concurrently; a timed-out thread finishes in the background
+        state, system = await asyncio.gather(
+            asyncio.wait_for(asyncio.to_thread(self.storage.load_state), timeout=self.check_timeout),
+            asyncio.wait_for(asyncio.to_thread(self._check_system_resources), timeout=self.check_timeout),
+            return_exceptions=True
+        )
         
-        # Check system resources
-        system_check = self._check_system_resources()
-        health_status["checks"]["system"] = system_check
+        # The state load checks that storage is accessible; the machine check
+        # reads the live state when there is a service, else the loaded one
+        if isinstance(state, Exception):
+            storage_check = self._failed_check("storage", state, "Storage error: ")
+        else:
+            storage_check = self._check_storage(state)
+        if self._service is not None:
+            machine_check = self._check_machine_state(self._service.state)
+        elif isinstance(state, Exception):
+            machine_check = dict(storage_check)
+        else:
+            machine_check = self._check_machine_state(state)
+        if isinstance(system, Exception):
+            system_check = self._failed_check("system", system)
+        else:
+            system_check = system
         
-        # Check coffee machine state
-        machine_check = await self._check_machine_state()
-        health_status["checks"]["machine"] = machine_check
+        health_status["checks"] = {
+            "storage": storage_check,
+            "system": system_check,
+            "machine": machine_check,
+        }
+        machine_source = state if self._service is None else None
+        timed_out = {
+            name for name, result in (("storage", state), ("machine", machine_source), ("system", system))
+            if isinstance(result, asyncio.TimeoutError)
+        }
         
-        # Determine overall status
-        if any(check.get("status") == "unhealthy" for check in health_status["checks"].values()):
-            health_status["status"] = "unhealthy"
-        elif any(check.get("status") == "degraded" for check in health_status["checks"].values()):
-            health_status["status"] = "degraded"
+        # Overall status is the worst check, found in a single pass; a timeout
+        # alone is inconclusive, so it degrades the system rather than failing it
+        worst = 0
+        for name, check in health_status["checks"].items():
+            severity = 1 if name in timed_out else _SEVERITY.get(check.get("status"), 0)
+            if severity > worst:
+                worst = severity
+        health_status["status"] = _STATUS_BY_SEVERITY[worst]
         
         return health_status
     
-    async def _check_storage(self) -> Dict[str, Any]:
-        """Check if storage is accessible and working."""
-        try:
-            state = self.storage.load_state()
-            return {
-                "status": "healthy",
-                "message": "Storage accessible",
-                "type": type(self.storage).__name__
-            }
-        except Exception as e:
-            logger.error("Storage health check failed", error=str(e))
-            return {
-                "status": "unhealthy",
-                "message": f"Storage error: {str(e)}"
-            }
+    def _failed_check(self, name: str, error: Exception, prefix: str = "") -> Dict[str, Any]:
+        """Build the result for a check that raised or timed out."""
+        if isinstance(error, asyncio.TimeoutError):
+            logger.warning("Health check timed out", check=name, timeout=self.check_timeout)
+            return {"status": "unhealthy", "message": "timeout"}
+        logger.error("Health check failed", check=name, error=str(error))
+        return {"status": "unhealthy", "message": f"{prefix}{error}"}
+    
+    def _check_storage(self, state: MachineState) -> Dict[str, Any]:
+        """Report storage as working once state has been loaded from it."""
+        return {
+            "status": "healthy",
+            "message": "Storage accessible",
+            "type": type(self.storage).__name__
+        }
     
     def _check_system_resources(self) -> Dict[str, Any]:
         """Check system CPU and memory usage."""
         try:
-            import psutil
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            cpu_percent = _last_cpu_percent
+            if cpu_percent is None:
+                # No background sample yet: usage since the last call, without blocking
+                cpu_percent = psutil.cpu_percent(interval=None)
+            memory, disk = _read_memory_and_disk()
             
             status = "healthy"
             warnings = []
@@ -104,15 +234,13 @@ class HealthChecker:
                 "message": f"Could not check system resources: {str(e)}"
             }
     
-    async def _check_machine_state(self) -> Dict[str, Any]:
+    def _check_machine_state(self, state: MachineState) -> Dict[str, Any]:
         """Check coffee machine state."""
         try:
-            state = self.storage.load_state()
-            
-            water_percent = (state.water_container.current_amount / 
-                           state.water_container.capacity) * 100 if state.water_container.capacity > 0 else 0
-            coffee_percent = (state.coffee_container.current_amount / 
-                            state.coffee_container.capacity) * 100 if state.coffee_container.capacity > 0 else 0
+            water = state.water_container
+            coffee = state.coffee_container
+            water_percent = water.current_amount * water.percent_per_unit
+            coffee_percent = coffee.current_amount * coffee.percent_per_unit
             
             status = "healthy"
             warnings = []
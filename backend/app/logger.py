@@ -1,10 +1,25 @@
 """Logging configuration for the coffee machine application."""
 import logging
+import queue
 import sys
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Optional
+import orjson
 import structlog
 
+# Set once setup_logging() has installed handlers, so repeated calls cannot stack them
+_configured = False
+
+# Records are queued by the calling thread and written by the listener's thread
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def _orjson_dumps(event: Any, **kwargs: Any) -> str:
+    """Serialize a log event with orjson, decoded to str for stdlib handlers."""
+    return orjson.dumps(event, **kwargs).decode()
+
 
 class LoggerSetup:
     """Configure application logging with structured logging support."""
@@ -14,6 +29,9 @@ class LoggerSetup:
         """
         Configure application logging.
         
+        Only the first call configures handlers and structlog; later calls
+        return the already configured logger.
+        
         Args:
             log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
             log_to_file: Whether to write logs to file
@@ -21,14 +39,20 @@ class LoggerSetup:
         Returns:
             Configured structlog logger
         """
+        global _configured, _queue_handler, _listener
+        if _configured:
+            return structlog.get_logger()
+        
         # Create logs directory
         log_dir = Path("logs")
         log_dir.mkdir(exist_ok=True)
         
         # Configure standard logging
-        log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
         
-        handlers = [logging.StreamHandler(sys.stdout)]
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(formatter)
+        handlers = [stream_handler]
         
         if log_to_file:
             file_handler = RotatingFileHandler(
@@ -36,14 +60,19 @@ class LoggerSetup:
                 maxBytes=10_000_000,  # 10MB
                 backupCount=5
             )
-            file_handler.setFormatter(logging.Formatter(log_format))
+            file_handler.setFormatter(formatter)
             handlers.append(file_handler)
         
-        logging.basicConfig(
-            level=getattr(logging, log_level.upper()),
-            format=log_format,
-            handlers=handlers
-        )
+        # Log calls only enqueue; console and file I/O (including rotation)
+        # happen on the listener thread, off the event loop
+        log_queue = queue.Queue(-1)
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        _queue_handler = QueueHandler(log_queue)
+        
+        root = logging.getLogger()
+        root.setLevel(getattr(logging, log_level.upper()))
+        root.addHandler(_queue_handler)
         
         # Configure structlog for structured logging
         structlog.configure(
@@ -56,16 +85,31 @@ class LoggerSetup:
                 structlog.processors.StackInfoRenderer(),
                 structlog.processors.format_exc_info,
                 structlog.processors.UnicodeDecoder(),
-                structlog.processors.JSONRenderer()
+                structlog.processors.JSONRenderer(serializer=_orjson_dumps)
             ],
             context_class=dict,
             logger_factory=structlog.stdlib.LoggerFactory(),
             cache_logger_on_first_use=True,
         )
+        _configured = True
         
         return structlog.get_logger()
+    
+    @staticmethod
+    def shutdown_logging():
+        """Flush queued records and remove the handlers installed by setup_logging()."""
+        global _configured, _queue_handler, _listener
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+            _queue_handler = None
+        _configured = False
 
 
-# Initialize logger with default settings
-logger = LoggerSetup.setup_logging()
+# Lazy proxy: binds to the configuration installed by setup_logging() at startup
+logger = structlog.get_logger()
 
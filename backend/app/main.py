@@ -1,38 +1,62 @@
 """FastAPI application for coffee machine API."""
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.config import get_settings
+from app.config import RuntimeConfig, get_settings
 from app.exceptions import (
     CoffeeMachineException,
     exception_handler
 )
 from app.services import CoffeeMachineService
 from app.storage import get_storage
-from app.dependencies import set_service_instance
 from app.api.v1.router import api_router as api_v1_router
-from app.rate_limiter import limiter, rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from app.middleware import RequestLoggingMiddleware, ErrorLoggingMiddleware
-from app.logger import logger
-from app.health import HealthChecker
-from app.api.v1.endpoints.health import set_health_checker
+from app.rate_limiter import limiter
+from app.middleware import RequestLoggingMiddleware, LegacyPrefixMiddleware
+from app.logger import LoggerSetup, logger
+from app.health import HealthChecker, sample_cpu
+from app.websocket_manager import manager
+
+
+async def _refresh_clock(app: FastAPI) -> None:
+    """Refresh the shared per-second timestamp used to stamp WebSocket frames."""
+    while True:
+        app.state.now_iso = datetime.now().isoformat(timespec="seconds")
+        await asyncio.sleep(1)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown."""
     # Startup
-    global _service_instance
     settings = get_settings()
+    LoggerSetup.setup_logging(settings.log_level)
+    app.state.runtime = RuntimeConfig.from_settings(settings)
     storage = get_storage(settings.storage_type, file_path=settings.data_path)
-    service_instance = CoffeeMachineService(storage)
-    set_service_instance(service_instance)
+    # The service is created once per process; reading the state file blocks,
+    # so it runs in a worker thread instead of on the event loop
+    state = await asyncio.to_thread(storage.load_state)
+    app.state.service = CoffeeMachineService(storage, state)
     
     # Initialize health checker
-    health_checker = HealthChecker(storage)
-    set_health_checker(health_checker)
+    app.state.health = HealthChecker(
+        storage,
+        probe_interval=settings.health_probe_interval,
+        check_timeout=settings.health_check_timeout,
+        service=app.state.service,
+    )
+    
+    await limiter.startup()
+    
+    app.state.now_iso = datetime.now().isoformat(timespec="seconds")
+    background_tasks = [
+        asyncio.create_task(_refresh_clock(app)),
+        asyncio.create_task(sample_cpu(settings.health_probe_interval)),
+        asyncio.create_task(app.state.service.run_broadcast_worker()),
+        asyncio.create_task(app.state.service.run_save_worker(settings.state_save_interval)),
+    ]
     
     logger.info(
         "api_started",
@@ -40,7 +64,15 @@ async def lifespan(app: FastAPI):
         version="1.0.0"
     )
     yield
-    # Shutdown (if needed)
+    # Shutdown
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await manager.close()
+    app.state.service.flush()
+    await limiter.close()
+    LoggerSetup.shutdown_logging()
 
 
 app = FastAPI(
@@ -73,6 +105,7 @@ app = FastAPI(
     All errors return user-friendly messages with detailed information about what went wrong.
     """,
     lifespan=lifespan,
+    exception_handlers={CoffeeMachineException: exception_handler},
     contact={
         "name": "Coffee Machine API",
     },
@@ -83,10 +116,10 @@ app = FastAPI(
 
 # Configure CORS
 settings = get_settings()
-origins = settings.cors_origins.split(",") if "," in settings.cors_origins else [settings.cors_origins]
+origins = sorted(settings.cors_origins_set)
 
 # Add middleware in order (last added is outermost)
-app.add_middleware(ErrorLoggingMiddleware)
+app.add_middleware(LegacyPrefixMiddleware, legacy_prefix="/api", target_prefix="/api/v1")
 app.add_middleware(RequestLoggingMiddleware)
 app.add_middleware(
     CORSMiddleware,
@@ -94,22 +127,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Request-ID",
+        "X-RateLimit-Limit",
+        "X-RateLimit-Remaining",
+        "X-RateLimit-Reset",
+        "Retry-After",
+    ],
 )
 
-# Add exception handlers
-app.add_exception_handler(CoffeeMachineException, exception_handler)
-app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
-
-# Add rate limiter to app state
-app.state.limiter = limiter
-
-# Include API v1 router with version prefix
+# Include API v1 router with version prefix; unversioned /api URLs are
+# rewritten onto it by LegacyPrefixMiddleware for backward compatibility
 app.include_router(api_v1_router, prefix="/api/v1")
 
-# Include API v1 router without version prefix for backward compatibility
-app.include_router(api_v1_router, prefix="/api")
-
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # "auto" picks uvloop/httptools when installed (falls back on Windows)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="auto", http="auto")
@@ -1,78 +1,147 @@
 """Request middleware for logging and error handling."""
+import logging
+import os
 import time
-import uuid
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.logger import logger
 
+# Random bytes handed out 4 at a time as request IDs, refilled when used up
+_REQUEST_ID_POOL_SIZE = 4096
+_request_id_pool = b""
+_request_id_offset = _REQUEST_ID_POOL_SIZE
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware to log all HTTP requests with timing and request IDs."""
+
+def new_request_id() -> str:
+    """
+    Return a random 8 hex character request ID.
+    
+    IDs are cut from a pooled os.urandom buffer, so most calls make no
+    syscall. The event loop is single threaded, so the pool needs no lock.
+    
+    Returns:
+        Request ID string
+    """
+    global _request_id_pool, _request_id_offset
+    if _request_id_offset >= _REQUEST_ID_POOL_SIZE:
+        _request_id_pool = os.urandom(_REQUEST_ID_POOL_SIZE)
+        _request_id_offset = 0
+    start = _request_id_offset
+    _request_id_offset = start + 4
+    return _request_id_pool[start:start + 4].hex()
+
+
+class RequestLoggingMiddleware:
+    """Middleware to log all HTTP requests with timing, request IDs and unhandled errors."""
+    
+    def __init__(self, app: ASGIApp):
+        """Initialize middleware around app."""
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Process request and log details."""
-        # Generate request ID
-        request_id = str(uuid.uuid4())[:8]
-        request.state.request_id = request_id
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Log request
-        logger.info(
-            "request_started",
-            request_id=request_id,
-            method=request.method,
-            url=str(request.url),
-            client_ip=request.client.host if request.client else "unknown",
-        )
+        # Generate request ID; exposed to handlers as request.state.request_id
+        request_id = new_request_id()
+        scope.setdefault("state", {})["request_id"] = request_id
+        # Read request fields from the scope once; no URL string is built
+        method = scope["method"]
+        path = scope["path"]
+        query = scope["query_string"].decode("latin-1")
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
         
-        start_time = time.time()
-        
-        # Process request
-        try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            # Log response
-            logger.info(
-                "request_completed",
+        # The completion record carries every start field, so the start
+        # event is only logged when debugging
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "request_started",
                 request_id=request_id,
-                method=request.method,
-                url=str(request.url),
-                status_code=response.status_code,
-                process_time=f"{process_time:.3f}s",
+                method=method,
+                path=path,
+                query=query,
+                client_ip=client_ip,
             )
-            
-            # Add request ID to response headers
-            response.headers["X-Request-ID"] = request_id
-            
-            return response
-            
+        
+        start = time.perf_counter_ns()
+        
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Log response
+                logger.info(
+                    "request_completed",
+                    request_id=request_id,
+                    method=method,
+                    path=path,
+                    query=query,
+                    client_ip=client_ip,
+                    status_code=message["status"],
+                    process_time_us=(time.perf_counter_ns() - start) // 1000,
+                )
+                
+                # Add request ID to response headers (new list: responses may be shared)
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"x-request-id", request_id.encode()),
+                ]
+            await send(message)
+        
+        # Process request; unhandled exceptions are logged with their traceback
+        try:
+            await self.app(scope, receive, send_with_request_id)
         except Exception as e:
-            process_time = time.time() - start_time
-            logger.error(
+            logger.exception(
                 "request_failed",
                 request_id=request_id,
-                method=request.method,
-                url=str(request.url),
+                method=method,
+                path=path,
+                query=query,
+                client_ip=client_ip,
                 error=str(e),
-                process_time=f"{process_time:.3f}s",
+                process_time_us=(time.perf_counter_ns() - start) // 1000,
             )
             raise
 
 
-class ErrorLoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware to log unhandled exceptions."""
+class LegacyPrefixMiddleware:
+    """
+    Serve unversioned ``/api/...`` URLs from the ``/api/v1`` routes.
     
-    async def dispatch(self, request: Request, call_next):
-        """Process request and log errors."""
-        try:
-            return await call_next(request)
-        except Exception as e:
-            logger.exception(
-                "unhandled_exception",
-                request_id=getattr(request.state, "request_id", "unknown"),
-                method=request.method,
-                url=str(request.url),
-                error=str(e),
-            )
-            raise
-
+    The v1 router is mounted once; older clients using the ``/api`` prefix
+    are rewritten in the ASGI scope instead of matching a second copy of
+    every route.
+    """
+    
+    def __init__(self, app: ASGIApp, legacy_prefix: str = "/api", target_prefix: str = "/api/v1"):
+        """
+        Initialize middleware.
+        
+        Args:
+            app: Wrapped ASGI application
+            legacy_prefix: Unversioned prefix still accepted from clients
+            target_prefix: Prefix the routes are actually mounted under
+        """
+        self.app = app
+        self.legacy_prefix = legacy_prefix
+        self.target_prefix = target_prefix
+        self._legacy_raw = legacy_prefix.encode()
+        self._target_raw = target_prefix.encode()
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Rewrite legacy paths for HTTP and WebSocket requests."""
+        if scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            if self._is_legacy(path):
+                scope = dict(scope)
+                scope["path"] = self.target_prefix + path[len(self.legacy_prefix):]
+                raw_path = scope.get("raw_path")
+                if raw_path:
+                    scope["raw_path"] = self._target_raw + raw_path[len(self._legacy_raw):]
+        await self.app(scope, receive, send)
+    
+    def _is_legacy(self, path: str) -> bool:
+        """Return whether path uses the legacy prefix and not the target prefix."""
+        if path != self.legacy_prefix and not path.startswith(self.legacy_prefix + "/"):
+            return False
+        return path != self.target_prefix and not path.startswith(self.target_prefix + "/")
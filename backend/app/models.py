@@ -1,9 +1,10 @@
 """Data models for the coffee machine."""
-from datetime import datetime
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Dict
-from pydantic import BaseModel, Field, field_validator
-from app.validators import ValidationHelpers
+from typing import Any, ClassVar, Dict, Tuple
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class CoffeeType(str, Enum):
@@ -14,30 +15,41 @@ class CoffeeType(str, Enum):
     AMERICANO = "americano"
 
 
-# Coffee recipes in grams and milliliters
-RECIPES: Dict[CoffeeType, Dict[str, float]] = {
-    CoffeeType.ESPRESSO: {"coffee": 8.0, "water": 24.0},
-    CoffeeType.DOUBLE_ESPRESSO: {"coffee": 16.0, "water": 48.0},
-    CoffeeType.RISTRETTO: {"coffee": 8.0, "water": 16.0},  # Short shot with less water
-    CoffeeType.AMERICANO: {"coffee": 16.0, "water": 148.0},
+# Coffee recipes as (coffee grams, water milliliters)
+RECIPES: Dict[CoffeeType, Tuple[float, float]] = {
+    CoffeeType.ESPRESSO: (8.0, 24.0),
+    CoffeeType.DOUBLE_ESPRESSO: (16.0, 48.0),
+    CoffeeType.RISTRETTO: (8.0, 16.0),  # Short shot with less water
+    CoffeeType.AMERICANO: (16.0, 148.0),
 }
 
 
-class WaterContainer(BaseModel):
-    """Container for water with capacity management."""
-    capacity: float = 2000.0  # ml
+@dataclass(slots=True)
+class _Container:
+    """
+    Container with capacity management.
+    
+    Plain slotted dataclass rather than a Pydantic model: the amount only
+    changes through dispense() and fill(), which check their own bounds, so
+    bounds are validated once at construction instead of on every update.
+    """
+    capacity: float
     current_amount: float = 0.0
-
-    @field_validator("current_amount")
-    @classmethod
-    def validate_current_amount(cls, v: float, info) -> float:
-        """Validate that current_amount is within bounds."""
-        capacity = info.data.get("capacity", 2000.0)
-        if v < 0:
+    # 100 / capacity (0 when capacity is 0), set once since capacity is fixed
+    # after creation; not part of the saved state
+    percent_per_unit: float = field(init=False, repr=False, compare=False)
+    # Unit used in messages (ml or g)
+    unit: ClassVar[str] = ""
+
+    def __post_init__(self) -> None:
+        """Validate that current_amount is within bounds and cache percent_per_unit."""
+        self.percent_per_unit = 100.0 / self.capacity if self.capacity > 0 else 0.0
+        if self.current_amount < 0:
             raise ValueError("current_amount cannot be negative")
-        if v > capacity:
-            raise ValueError(f"current_amount ({v}) cannot exceed capacity ({capacity})")
-        return v
+        if self.current_amount > self.capacity:
+            raise ValueError(
+                f"current_amount ({self.current_amount}) cannot exceed capacity ({self.capacity})"
+            )
 
     def can_dispense(self, amount: float) -> bool:
         """Check if container can dispense the requested amount."""
@@ -48,93 +60,121 @@ class WaterContainer(BaseModel):
         return (self.current_amount + amount) <= self.capacity
 
     def dispense(self, amount: float) -> None:
-        """Dispense water from container."""
+        """Dispense from container."""
         if not self.can_dispense(amount):
-            raise ValueError(f"Cannot dispense {amount}ml, only {self.current_amount}ml available")
+            raise ValueError(
+                f"Cannot dispense {amount}{self.unit}, only {self.current_amount}{self.unit} available"
+            )
         self.current_amount -= amount
 
     def fill(self, amount: float) -> None:
-        """Fill container with water."""
+        """Fill container."""
         if not self.can_fill(amount):
-            raise ValueError(f"Cannot add {amount}ml, would exceed capacity")
+            raise ValueError(f"Cannot add {amount}{self.unit}, would exceed capacity")
         self.current_amount += amount
 
 
-class CoffeeContainer(BaseModel):
+@dataclass(slots=True)
+class WaterContainer(_Container):
+    """Container for water with capacity management."""
+    capacity: float = 2000.0  # ml
+    unit: ClassVar[str] = "ml"
+
+
+@dataclass(slots=True)
+class CoffeeContainer(_Container):
     """Container for coffee with capacity management."""
     capacity: float = 500.0  # grams
-    current_amount: float = 0.0
+    unit: ClassVar[str] = "g"
 
-    @field_validator("current_amount")
-    @classmethod
-    def validate_current_amount(cls, v: float, info) -> float:
-        """Validate that current_amount is within bounds."""
-        capacity = info.data.get("capacity", 500.0)
-        if v < 0:
-            raise ValueError("current_amount cannot be negative")
-        if v > capacity:
-            raise ValueError(f"current_amount ({v}) cannot exceed capacity ({capacity})")
-        return v
 
-    def can_dispense(self, amount: float) -> bool:
-        """Check if container can dispense the requested amount."""
-        return self.current_amount >= amount
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
-    def can_fill(self, amount: float) -> bool:
-        """Check if container can be filled by the requested amount."""
-        return (self.current_amount + amount) <= self.capacity
 
-    def dispense(self, amount: float) -> None:
-        """Dispense coffee from container."""
-        if not self.can_dispense(amount):
-            raise ValueError(f"Cannot dispense {amount}g, only {self.current_amount}g available")
-        self.current_amount -= amount
+def datetime_to_ns(value: datetime) -> int:
+    """Convert a datetime (naive means local time) to epoch nanoseconds."""
+    return (value.astimezone(timezone.utc) - _EPOCH) // timedelta(microseconds=1) * 1000
 
-    def fill(self, amount: float) -> None:
-        """Fill container with coffee."""
-        if not self.can_fill(amount):
-            raise ValueError(f"Cannot add {amount}g, would exceed capacity")
-        self.current_amount += amount
+
+def ns_to_datetime(value: int) -> datetime:
+    """Convert epoch nanoseconds to a naive local datetime, like datetime.now()."""
+    return (_EPOCH + timedelta(microseconds=value // 1000)).astimezone().replace(tzinfo=None)
 
 
 class MachineState(BaseModel):
     """Machine state including containers and statistics."""
+    # Scalar fields are strict (e.g. "5" is not accepted as 5); the containers
+    # accept a dataclass instance or a dict of their fields
     water_container: WaterContainer
     coffee_container: CoffeeContainer
-    total_coffees_made: int = 0
-    last_updated: datetime = Field(default_factory=datetime.now)
+    total_coffees_made: int = Field(default=0, strict=True)
+    # Time of the last change as epoch nanoseconds; converted to a datetime only when read
+    last_updated_ns: int = Field(default_factory=time.time_ns, strict=True)
+
+    @model_validator(mode="before")
+    @classmethod
+    def convert_last_updated(cls, data: Any) -> Any:
+        """Accept a last_updated datetime or ISO 8601 string in place of last_updated_ns."""
+        if isinstance(data, dict) and "last_updated" in data:
+            data = dict(data)
+            last_updated = data.pop("last_updated")
+            if isinstance(last_updated, str):
+                # Saved state files store the timestamp as ISO 8601
+                last_updated = datetime.fromisoformat(last_updated)
+            elif last_updated is not None and not isinstance(last_updated, datetime):
+                raise ValueError("last_updated must be a datetime or an ISO 8601 string")
+            if last_updated is not None:
+                data["last_updated_ns"] = datetime_to_ns(last_updated)
+        return data
+
+    @property
+    def last_updated(self) -> datetime:
+        """Return the time of the last change as a naive local datetime."""
+        return ns_to_datetime(self.last_updated_ns)
 
 
 # Request/Response Models
+# Constraints are checked by Pydantic's core without Python callbacks; API
+# models ignore unknown fields and are immutable once built
 class FillRequest(BaseModel):
     """Request model for filling containers."""
-    amount: float = Field(gt=0, description="Amount to fill (must be positive)")
+    model_config = ConfigDict(extra="ignore", frozen=True)
 
-    @field_validator("amount")
-    @classmethod
-    def validate_amount(cls, v: float) -> float:
-        """Validate that amount is positive and reasonable."""
-        # Use ValidationHelpers for consistent validation
-        ValidationHelpers.validate_positive_number(v, "amount")
-        # Max 10L water or 2kg coffee in single fill
-        ValidationHelpers.validate_reasonable_amount(v, 10000, "amount")
-        return v
+    # Max 10L water or 2kg coffee in single fill
+    amount: float = Field(gt=0, le=10000, description="Amount to fill (must be positive, at most 10000)")
 
 
 class MessageResponse(BaseModel):
     """Response model for operations returning a message."""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     success: bool
     message: str
 
 
+class FillResponse(BaseModel):
+    """Response model for fill operations; clients format the message."""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    success: bool
+    container: str
+    added: float
+    current: float
+    capacity: float
+
+
 class StatusResponse(BaseModel):
     """Response model for status requests."""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     success: bool
     data: dict
 
 
 class ErrorResponse(BaseModel):
     """Response model for errors."""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     success: bool = False
     message: str
     error_type: str
@@ -1,44 +1,384 @@
-"""Rate limiting configuration for the API."""
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi import Request
-from starlette.responses import JSONResponse
+"""Rate limiting configuration for the API.
+
+Limits are enforced with a sliding-window log. With a ``redis://`` storage URI
+the window is kept in Redis so every uvicorn worker shares a single budget;
+``memory://`` keeps a per-process window for local development and tests.
+With Redis, an opt-in local pre-filter admits clients well below their limit
+without a round-trip; each worker may admit up to that fraction of a limit
+before Redis sees the hits, so N workers can admit up to N times that
+fraction in total.
+"""
+import bisect
+import ipaddress
+import itertools
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, Request, Response
+
+from app.config import get_settings
+from app.exceptions import RateLimitExceededException
+
+
+# Sliding-window log: drop expired hits, record hits already admitted by the
+# local pre-filter at the time they happened (ARGV[5..] holds pairs of age in
+# ms and hit count), count what is left with ZCARD and record the new hit only
+# when the client is still under its limit. Runs atomically in a single
+# round-trip and returns {allowed, remaining, reset_ms} where reset_ms is the
+# time until the oldest hit leaves the window. Handed-over hits can push the
+# count past the limit, so remaining is clamped at 0.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local admitted = false
+
+redis.call("ZREMRANGEBYSCORE", key, 0, now - window)
+for i = 5, #ARGV, 2 do
+    local at = now - tonumber(ARGV[i])
+    if at > now - window then
+        for j = 1, tonumber(ARGV[i + 1]) do
+            redis.call("ZADD", key, at, ARGV[4] .. ":" .. i .. ":" .. j)
+        end
+        admitted = true
+    end
+end
+local count = redis.call("ZCARD", key)
+local allowed = 0
+if count < limit then
+    redis.call("ZADD", key, now, ARGV[4])
+    redis.call("PEXPIRE", key, window)
+    count = count + 1
+    allowed = 1
+end
+if admitted then
+    redis.call("PEXPIRE", key, window)
+end
+local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")
+return {allowed, math.max(0, limit - count), tonumber(oldest[2]) + window - now}
+"""
+
+
+# Hits admitted by the pre-filter, as (age in ms, hit count) pairs
+AdmittedHits = Sequence[Tuple[int, int]]
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a single rate limit check."""
+    allowed: bool
+    remaining: int
+    reset_ms: int
 
 
 def get_remote_address_with_proxy(request: Request) -> str:
     """
     Get client IP address, handling proxy headers.
+    
+    The result is cached as ``request.state.client_ip`` so later lookups in
+    the same request do not parse the headers again.
+    """
+    state = request.scope.setdefault("state", {})
+    client_ip = state.get("client_ip")
+    if client_ip is None:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            # Only the leftmost (original client) address is needed
+            comma = forwarded.find(",")
+            client_ip = (forwarded if comma < 0 else forwarded[:comma]).strip()
+        else:
+            client_ip = request.client.host if request.client else "unknown"
+        state["client_ip"] = client_ip
+    return client_ip
+
+
+# Compact per-endpoint ids used in rate limit keys, assigned in route definition
+# order by assign_route_ids() so every worker derives the same mapping.
+_route_ids: Dict[Callable, bytes] = {}
+
+
+def assign_route_ids(*routers: APIRouter) -> None:
+    """
+    Assign a one-byte id to each endpoint of routers that does not have one yet.
+    
+    Args:
+        routers: Rate limited endpoint routers, in a fixed order
+        
+    Raises:
+        ValueError: If more than 256 endpoints need an id
     """
-    forwarded = request.headers.get("X-Forwarded-For")
-    if forwarded:
-        return forwarded.split(",")[0].strip()
-    return request.client.host if request.client else "unknown"
+    for router in routers:
+        for route in router.routes:
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is not None and endpoint not in _route_ids:
+                if len(_route_ids) > 0xFF:
+                    raise ValueError("Too many routes for one-byte rate limit ids")
+                _route_ids[endpoint] = bytes([len(_route_ids)])
+
+
+@lru_cache(maxsize=4096)
+def _pack_address(address: str) -> bytes:
+    """Pack an IPv4/IPv6 address to 4/16 bytes; other identifiers are kept as text."""
+    try:
+        return ipaddress.ip_address(address).packed
+    except ValueError:
+        return address.encode()
+
+
+def _rate_limit_key(request: Request) -> bytes:
+    """Build a short binary key: ``r`` + route id + packed client address."""
+    endpoint = request.scope.get("endpoint")
+    route_id = _route_ids.get(endpoint)
+    if route_id is None:
+        # Endpoint outside the assigned router: fall back to its name
+        route_id = (endpoint.__name__ if endpoint else request.url.path).encode() + b":"
+    return b"r" + route_id + _pack_address(get_remote_address_with_proxy(request))
+
+
+class MemoryRateLimitBackend:
+    """Per-process sliding-window log, used with ``memory://`` storage."""
+
+    def __init__(self):
+        """Initialize empty hit log."""
+        self._hits: Dict[bytes, Deque[int]] = {}
+
+    async def startup(self) -> None:
+        """Nothing to prepare for the in-process log."""
+
+    async def hit(self, key: bytes, limit: int, window_ms: int, admitted: AdmittedHits = ()) -> RateLimitResult:
+        """Record a hit for key if it is within the limit, after any hits admitted elsewhere."""
+        now = time.time_ns() // 1_000_000
+        hits = self._hits.setdefault(key, deque())
+        while hits and hits[0] <= now - window_ms:
+            hits.popleft()
+        for age_ms, count in admitted:
+            at = now - age_ms
+            if at > now - window_ms:
+                # Keep the log ordered by time
+                for _ in range(count):
+                    bisect.insort(hits, at)
+        allowed = len(hits) < limit
+        if allowed:
+            hits.append(now)
+        return RateLimitResult(allowed, max(0, limit - len(hits)), hits[0] + window_ms - now)
+
+    async def close(self) -> None:
+        """Release backend resources."""
+        self._hits.clear()
+
+
+class RedisRateLimitBackend:
+    """Sliding-window log shared by all workers through Redis."""
+
+    def __init__(self, url: str):
+        """Create a lazily-connecting Redis client for url."""
+        import redis.asyncio as redis
+        from redis.exceptions import NoScriptError
+
+        self._client = redis.from_url(url)
+        self._no_script_error = NoScriptError
+        self._sha: Optional[str] = None
+        self._sequence = itertools.count()
+
+    async def startup(self) -> None:
+        """Load the sliding-window script so checks can use EVALSHA."""
+        self._sha = await self._client.script_load(SLIDING_WINDOW_SCRIPT)
 
+    async def hit(self, key: bytes, limit: int, window_ms: int, admitted: AdmittedHits = ()) -> RateLimitResult:
+        """Record a hit for key if it is within the limit, after any hits admitted elsewhere."""
+        now = time.time_ns() // 1_000_000
+        # Members must be unique so hits landing in the same millisecond count separately
+        member = f"{now}-{next(self._sequence)}"
+        args = (key, now, window_ms, limit, member, *itertools.chain.from_iterable(admitted))
+        if self._sha is None:
+            await self.startup()
+        try:
+            allowed, remaining, reset_ms = await self._client.evalsha(self._sha, 1, *args)
+        except self._no_script_error:
+            # Script cache was flushed (e.g. Redis restart): reload and retry once
+            await self.startup()
+            allowed, remaining, reset_ms = await self._client.evalsha(self._sha, 1, *args)
+        return RateLimitResult(bool(allowed), int(remaining), int(reset_ms))
 
-# Create rate limiter with memory-based storage
-# For production with Redis, change to: "redis://redis:6379"
-limiter = Limiter(
-    key_func=get_remote_address_with_proxy,
-    default_limits=["100/hour"],
-    storage_uri="memory://",
+    async def close(self) -> None:
+        """Close the Redis connection pool."""
+        await self._client.aclose()
+
+
+class _PreFilterEntry:
+    """One-second hit buckets of a single key, as [second, hits, hits not yet sent]."""
+    __slots__ = ("buckets",)
+
+    def __init__(self):
+        self.buckets: Deque[List[int]] = deque()
+
+
+class LocalPreFilter:
+    """
+    In-process hit counter that admits clients well below their limit.
+
+    Hits are counted per key in one-second buckets. While a key has fewer
+    than ``ratio * limit`` hits in its window, the hit is admitted without
+    consulting the shared backend. Those admitted hits are handed to the
+    backend with the next check that does reach it, with the age of their
+    bucket, so its count stays complete once a client nears the limit. Keys unused for longest are
+    evicted beyond ``max_keys``.
+    """
+
+    def __init__(self, ratio: float = 0.8, max_keys: int = 10_000):
+        """
+        Initialize an empty pre-filter.
+
+        Args:
+            ratio: Fraction of the limit admitted locally
+            max_keys: Maximum number of keys tracked
+        """
+        self.ratio = ratio
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[bytes, _PreFilterEntry]" = OrderedDict()
+
+    def hit(self, key: bytes, limit: int, window_seconds: int) -> Tuple[bool, int, List[Tuple[int, int]]]:
+        """
+        Count a hit for key.
+
+        Args:
+            key: Rate limit key
+            limit: Maximum number of requests allowed in the window
+            window_seconds: Length of the window in seconds
+
+        Returns:
+            ``(True, hits in window, [])`` when the hit is admitted locally, or
+            ``(False, 0, admitted hits not yet sent)`` when the backend must
+            decide, as (age in ms, hit count) pairs per bucket
+        """
+        now = int(time.monotonic())
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _PreFilterEntry()
+            if len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+
+        buckets = entry.buckets
+        while buckets and buckets[0][0] <= now - window_seconds:
+            buckets.popleft()
+        count = sum(bucket[1] for bucket in buckets)
+        if not buckets or buckets[-1][0] != now:
+            buckets.append([now, 0, 0])
+        current = buckets[-1]
+        current[1] += 1
+
+        if count + 1 <= self.ratio * limit:
+            current[2] += 1
+            return True, count + 1, []
+
+        # Buckets are stamped with the second they started, so a handed-over
+        # hit may look up to a second older than it is
+        now_ms = int(time.monotonic() * 1000)
+        unsent = []
+        for bucket in buckets:
+            if bucket[2]:
+                unsent.append((now_ms - bucket[0] * 1000, bucket[2]))
+                bucket[2] = 0
+        return False, 0, unsent
+
+    def reset_ms(self, key: bytes, window_seconds: int) -> int:
+        """
+        Return the time until the oldest bucket of key leaves the window.
+
+        Args:
+            key: Rate limit key that was just counted by hit()
+            window_seconds: Length of the window in seconds
+
+        Returns:
+            Milliseconds until the oldest counted hit expires
+        """
+        oldest = self._entries[key].buckets[0][0]
+        age_ms = int(time.monotonic() * 1000) - oldest * 1000
+        return max(0, window_seconds * 1000 - age_ms)
+
+
+class SlidingWindowRateLimiter:
+    """Rate limiter that delegates hit accounting to a storage backend."""
+
+    def __init__(self, storage_uri: str, enabled: bool = True, prefilter_ratio: float = 0.0):
+        """
+        Initialize limiter for the given storage URI.
+
+        Args:
+            storage_uri: ``memory://`` or a ``redis://`` / ``rediss://`` URL
+            enabled: Whether limits are enforced at all
+            prefilter_ratio: Fraction of each limit admitted in-process before
+                the Redis backend is consulted, per worker; 0 disables the
+                pre-filter
+        """
+        self.enabled = enabled
+        self.prefilter: Optional[LocalPreFilter] = None
+        if storage_uri.startswith(("redis://", "rediss://")):
+            self.backend = RedisRateLimitBackend(storage_uri)
+            if prefilter_ratio > 0:
+                self.prefilter = LocalPreFilter(prefilter_ratio)
+        elif storage_uri.startswith("memory://"):
+            self.backend = MemoryRateLimitBackend()
+        else:
+            raise ValueError(f"Unsupported rate limit storage: {storage_uri}")
+
+    async def startup(self) -> None:
+        """Prepare the backend; called once from the application lifespan."""
+        if self.enabled:
+            await self.backend.startup()
+
+    async def hit(self, key: bytes, limit: int, window_seconds: int) -> RateLimitResult:
+        """Record a hit for key if it is within the limit."""
+        admitted: AdmittedHits = ()
+        if self.prefilter is not None:
+            local, count, admitted = self.prefilter.hit(key, limit, window_seconds)
+            if local:
+                # Far from the limit: no backend round-trip
+                return RateLimitResult(True, limit - count, self.prefilter.reset_ms(key, window_seconds))
+        return await self.backend.hit(key, limit, window_seconds * 1000, admitted)
+
+    async def close(self) -> None:
+        """Release backend resources."""
+        await self.backend.close()
+
+
+_settings = get_settings()
+limiter = SlidingWindowRateLimiter(
+    _settings.rate_limit_storage,
+    enabled=_settings.rate_limit_enabled,
+    prefilter_ratio=_settings.rate_limit_prefilter_ratio,
 )
 
 
-async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+def rate_limit(limit: int, window_seconds: int = 60) -> Callable:
     """
-    Custom handler for rate limit exceeded errors.
-    Returns user-friendly JSON response.
+    Create a dependency enforcing ``limit`` requests per ``window_seconds``.
+
+    Args:
+        limit: Maximum number of requests allowed in the window
+        window_seconds: Length of the sliding window in seconds
+
+    Returns:
+        FastAPI dependency that sets ``X-RateLimit-*`` headers on the response
+        and raises RateLimitExceededException when over the limit
     """
-    return JSONResponse(
-        status_code=429,
-        content={
-            "success": False,
-            "message": "Rate limit exceeded. Please try again later.",
-            "error_type": "RateLimitExceeded",
-            "details": {
-                "retry_after": exc.detail if exc.detail else "1 hour"
-            }
+    async def dependency(request: Request, response: Response) -> None:
+        if not limiter.enabled:
+            return
+        result = await limiter.hit(_rate_limit_key(request), limit, window_seconds)
+        # Round up so clients never retry before the window has actually moved
+        reset_seconds = -(-result.reset_ms // 1000)
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(result.remaining),
+            "X-RateLimit-Reset": str(reset_seconds),
         }
-    )
+        if not result.allowed:
+            raise RateLimitExceededException(limit, window_seconds, reset_seconds, headers)
+        response.headers.update(headers)
 
+    return dependency
@@ -1,6 +1,10 @@
 """Business logic service for coffee machine operations."""
 import asyncio
-from datetime import datetime
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import orjson
 from app.models import (
     MachineState,
     CoffeeType,
@@ -18,16 +22,159 @@ from app.config import get_settings
 from app.logger import logger
 from app.websocket_manager import manager
 
+# How long a computed status snapshot may be reused (seconds)
+STATUS_CACHE_TTL = 0.1
+
+# Fraction of capacity below which a container is reported as low
+LOW_LEVEL_FRACTION = 0.2
+
+# Pending WebSocket broadcasts; further events are dropped while it is full
+BROADCAST_QUEUE_SIZE = 1024
+
+# Message returned when each coffee type is ready
+COFFEE_READY_MESSAGES: Dict[CoffeeType, str] = {
+    CoffeeType.ESPRESSO: "Espresso ready! ☕",
+    CoffeeType.DOUBLE_ESPRESSO: "Double espresso ready! ☕",
+    CoffeeType.RISTRETTO: "Ristretto ready! ☕",
+    CoffeeType.AMERICANO: "Americano ready! ☕",
+}
+
 
 class CoffeeMachineService:
     """Service for managing coffee machine operations."""
     
-    def __init__(self, storage: StorageInterface):
-        """Initialize service with storage backend."""
+    def __init__(self, storage: StorageInterface, state: Optional[MachineState] = None):
+        """
+        Initialize service with storage backend.
+        
+        Args:
+            storage: Storage backend used to persist state
+            state: Already loaded state; loaded from storage when omitted
+        """
         self.storage = storage
-        self.state = self.storage.load_state()
+        self.state = state if state is not None else self.storage.load_state()
+        self._status_cache = None
+        self._status_cached_at = 0.0
+        # Serialized status and ETag, with the last_updated_ns they were built for
+        self._status_json: Optional[Tuple[bytes, str]] = None
+        self._status_json_ns: Optional[int] = None
+        self._last_updated_ns: Optional[int] = None
+        self._last_updated_iso = ""
+        # (kind, payload) events drained by run_broadcast_worker()
+        self._broadcast_queue: asyncio.Queue = asyncio.Queue(maxsize=BROADCAST_QUEUE_SIZE)
+        # Set when state changed since the last save; cleared by flush()
+        self._dirty = False
+        # Wakes the save worker before its interval ends (e.g. after reset)
+        self._save_requested = asyncio.Event()
+        # Every snapshot taken for saving gets the next sequence number; a
+        # write is skipped once a later snapshot has been written
+        self._save_seq = 0
+        self._saved_seq = 0
+        self._save_lock = threading.Lock()
+        self._update_low_levels()
         logger.info("service_initialized", storage_type=type(storage).__name__)
     
+    def _queue_broadcast(self, kind: str, payload: Any = None) -> None:
+        """Queue a WebSocket broadcast, dropping it when the queue is full."""
+        try:
+            self._broadcast_queue.put_nowait((kind, payload))
+        except asyncio.QueueFull:
+            logger.warning("Broadcast queue full, dropping event", kind=kind)
+    
+    async def run_broadcast_worker(self) -> None:
+        """
+        Send queued broadcasts to WebSocket clients, one at a time.
+        
+        Runs for the lifetime of the application. Status updates are built
+        here, off the request path, so they reflect the latest state.
+        """
+        while True:
+            kind, payload = await self._broadcast_queue.get()
+            try:
+                if kind == "status":
+                    await manager.broadcast_status_update(self.get_status()["data"])
+                elif kind == "coffee_made":
+                    await manager.broadcast_coffee_made(*payload)
+            except Exception as e:
+                logger.warning("Failed to broadcast WebSocket message", error=str(e))
+    
+    def _next_save_seq(self) -> int:
+        """Return the sequence number for a snapshot taken now."""
+        self._save_seq += 1
+        return self._save_seq
+    
+    def _save(self, state: MachineState, seq: int) -> None:
+        """
+        Write a snapshot unless a later one has already been written.
+        
+        Args:
+            state: State to save
+            seq: Sequence number from _next_save_seq() when state was taken
+        """
+        with self._save_lock:
+            if seq <= self._saved_seq:
+                return
+            self.storage.save_state(state)
+            self._saved_seq = seq
+    
+    def flush(self) -> None:
+        """Save state to storage if it changed since the last save."""
+        if self._dirty:
+            self._save(self.state, self._next_save_seq())
+            self._dirty = False
+    
+    async def run_save_worker(self, interval: float = 1.0) -> None:
+        """
+        Persist state changes every interval seconds.
+        
+        Operations only mark state dirty, so a burst of requests costs one
+        write instead of one per request. The state is copied on the event
+        loop and written in a worker thread, so requests never wait on disk.
+        Runs for the lifetime of the application; call flush() on shutdown
+        to save the final changes. Writes are sequenced, so a snapshot still
+        being written can never replace a later one.
+        
+        Args:
+            interval: Seconds between saves
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._save_requested.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._save_requested.clear()
+            if not self._dirty:
+                continue
+            snapshot = self.state.model_copy(deep=True)
+            seq = self._next_save_seq()
+            self._dirty = False
+            write = asyncio.ensure_future(asyncio.to_thread(self._save, snapshot, seq))
+            try:
+                # Shielded so cancellation on shutdown lets an in-flight write
+                # finish before flush() saves the final state
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                try:
+                    await write
+                except Exception as e:
+                    # Leave the state dirty so flush() retries the save
+                    self._dirty = True
+                    logger.error("Failed to save state", error=str(e))
+                raise
+            except Exception as e:
+                self._dirty = True
+                logger.error("Failed to save state", error=str(e))
+    
+    def _update_low_levels(self) -> None:
+        """Precompute the amounts below which containers count as low; capacities change only on reset."""
+        self._water_low_level = LOW_LEVEL_FRACTION * self.state.water_container.capacity
+        self._coffee_low_level = LOW_LEVEL_FRACTION * self.state.coffee_container.capacity
+    
+    def _invalidate_status(self) -> None:
+        """Drop the cached status snapshot after a state change."""
+        self._status_cache = None
+        self._status_json = None
+    
     def make_coffee(self, coffee_type: CoffeeType) -> dict:
         """
         Make coffee of the specified type.
@@ -43,49 +190,38 @@ class CoffeeMachineService:
         """
         logger.info(f"Making {coffee_type.value}", coffee_type=coffee_type.value)
         
-        recipe = RECIPES.get(coffee_type)
-        if not recipe:
-            logger.error("Unknown coffee type", coffee_type=coffee_type.value)
-            raise ValueError(f"Unknown coffee type: {coffee_type}")
-        
-        water_needed = recipe["water"]
-        coffee_needed = recipe["coffee"]
-        
-        # Check water availability
-        if not self.state.water_container.can_dispense(water_needed):
-            logger.warning(
-                "Insufficient water",
-                coffee_type=coffee_type.value,
-                needed=water_needed,
-                available=self.state.water_container.current_amount
-            )
-            raise InsufficientResourcesException(
-                "water",
-                water_needed,
-                self.state.water_container.current_amount
-            )
-        
-        # Check coffee availability
-        if not self.state.coffee_container.can_dispense(coffee_needed):
+        # coffee_type is a validated CoffeeType and every type has a recipe
+        coffee_needed, water_needed = RECIPES[coffee_type]
+        
+        water = self.state.water_container
+        coffee = self.state.coffee_container
+        
+        # One combined check on the happy path; work out which resource is short only on failure
+        if water.current_amount < water_needed or coffee.current_amount < coffee_needed:
+            if water.current_amount < water_needed:
+                logger.warning(
+                    "Insufficient water",
+                    coffee_type=coffee_type.value,
+                    needed=water_needed,
+                    available=water.current_amount
+                )
+                raise InsufficientResourcesException("water", water_needed, water.current_amount)
             logger.warning(
                 "Insufficient coffee",
                 coffee_type=coffee_type.value,
                 needed=coffee_needed,
-                available=self.state.coffee_container.current_amount
-            )
-            raise InsufficientResourcesException(
-                "coffee",
-                coffee_needed,
-                self.state.coffee_container.current_amount
+                available=coffee.current_amount
             )
+            raise InsufficientResourcesException("coffee", coffee_needed, coffee.current_amount)
         
-        # Dispense resources
-        self.state.water_container.dispense(water_needed)
-        self.state.coffee_container.dispense(coffee_needed)
+        # Dispense resources (availability already checked above)
+        water.current_amount -= water_needed
+        coffee.current_amount -= coffee_needed
         
         # Increment counter
         self.state.total_coffees_made += 1
-        self.state.last_updated = datetime.now()
+        self.state.last_updated_ns = time.time_ns()
+        self._invalidate_status()
         
         # Log success
         logger.info(
@@ -97,73 +233,93 @@ class CoffeeMachineService:
         )
         
         # Broadcast to WebSocket clients
-        try:
-            asyncio.create_task(manager.broadcast_coffee_made(
-                coffee_type.value,
-                {"coffee": coffee_needed, "water": water_needed}
-            ))
-            # Broadcast updated status
-            status = self.get_status()
-            asyncio.create_task(manager.broadcast_status_update(status["data"]))
-        except Exception as e:
-            logger.warning("Failed to broadcast WebSocket message", error=str(e))
-        
-        # Check if resources are low
-        water_percentage = (self.state.water_container.current_amount / 
-                           self.state.water_container.capacity) * 100
-        coffee_percentage = (self.state.coffee_container.current_amount / 
-                            self.state.coffee_container.capacity) * 100
-        
-        if water_percentage < 20:
-            logger.warning("Water level low", percentage=round(water_percentage, 1))
-        if coffee_percentage < 20:
-            logger.warning("Coffee level low", percentage=round(coffee_percentage, 1))
-        
-        # Persist state
-        self.storage.save_state(self.state)
+        self._queue_broadcast(
+            "coffee_made",
+            (coffee_type.value, {"coffee": coffee_needed, "water": water_needed})
+        )
+        # Broadcast updated status
+        self._queue_broadcast("status")
         
-        # Return success message
-        messages = {
-            CoffeeType.ESPRESSO: "Espresso ready! ☕",
-            CoffeeType.DOUBLE_ESPRESSO: "Double espresso ready! ☕",
-            CoffeeType.RISTRETTO: "Ristretto ready! ☕",
-            CoffeeType.AMERICANO: "Americano ready! ☕",
-        }
+        # Check if resources are low; percentages are computed only to log them
+        if water.current_amount < self._water_low_level:
+            logger.warning(
+                "Water level low",
+                percentage=round(water.current_amount * water.percent_per_unit, 1)
+            )
+        if coffee.current_amount < self._coffee_low_level:
+            logger.warning(
+                "Coffee level low",
+                percentage=round(coffee.current_amount * coffee.percent_per_unit, 1)
+            )
         
+        # Persist state with the next save
+        self._dirty = True
+        
+        # Return success message
         return {
             "success": True,
-            "message": messages.get(coffee_type, "Coffee ready! ☕")
+            "message": COFFEE_READY_MESSAGES.get(coffee_type, "Coffee ready! ☕")
         }
     
     def get_status(self) -> dict:
         """
         Get current machine status.
         
+        The snapshot is reused for up to STATUS_CACHE_TTL seconds so bursts of
+        readers (e.g. WebSocket reconnects) build it once; mutations through
+        the service invalidate it immediately.
+        
         Returns:
             Dictionary with success status and status data
         """
-        water_percentage = (
-            (self.state.water_container.current_amount / self.state.water_container.capacity) * 100
-            if self.state.water_container.capacity > 0 else 0.0
-        )
-        coffee_percentage = (
-            (self.state.coffee_container.current_amount / self.state.coffee_container.capacity) * 100
-            if self.state.coffee_container.capacity > 0 else 0.0
-        )
+        now = time.monotonic()
+        if self._status_cache is not None and now - self._status_cached_at < STATUS_CACHE_TTL:
+            return self._status_cache
         
-        return {
+        water = self.state.water_container
+        coffee = self.state.coffee_container
+        
+        # Formatting the timestamp is only needed when it changed
+        last_updated_ns = self.state.last_updated_ns
+        if last_updated_ns != self._last_updated_ns:
+            self._last_updated_ns = last_updated_ns
+            self._last_updated_iso = self.state.last_updated.isoformat()
+        
+        # Percentages are sent unrounded; clients format them for display
+        self._status_cache = {
             "success": True,
             "data": {
-                "water_level": self.state.water_container.current_amount,
-                "water_capacity": self.state.water_container.capacity,
-                "water_percentage": round(water_percentage, 2),
-                "coffee_level": self.state.coffee_container.current_amount,
-                "coffee_capacity": self.state.coffee_container.capacity,
-                "coffee_percentage": round(coffee_percentage, 2),
+                "water_level": water.current_amount,
+                "water_capacity": water.capacity,
+                "water_percentage": water.current_amount * water.percent_per_unit,
+                "coffee_level": coffee.current_amount,
+                "coffee_capacity": coffee.capacity,
+                "coffee_percentage": coffee.current_amount * coffee.percent_per_unit,
                 "total_coffees_made": self.state.total_coffees_made,
-                "last_updated": self.state.last_updated.isoformat()
+                "last_updated": self._last_updated_iso
             }
         }
+        self._status_cached_at = now
+        return self._status_cache
+    
+    def get_status_json(self) -> Tuple[bytes, str]:
+        """
+        Get current machine status serialized for HTTP responses.
+        
+        The body and its ETag are built once per state change (keyed on
+        last_updated_ns and dropped by service operations), so repeated polls
+        of an unchanged machine skip building and serializing the status.
+        
+        Returns:
+            Tuple of (JSON body, quoted ETag)
+        """
+        last_updated_ns = self.state.last_updated_ns
+        if self._status_json is None or self._status_json_ns != last_updated_ns:
+            body = orjson.dumps(self.get_status())
+            etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+            self._status_json = (body, etag)
+            self._status_json_ns = last_updated_ns
+        return self._status_json
     
     def fill_water(self, amount: float) -> dict:
         """
@@ -173,7 +329,7 @@ class CoffeeMachineService:
             amount: Amount of water to add (ml)
             
         Returns:
-            Dictionary with success status and message
+            Dictionary with success status, amount added and the new water level
             
         Raises:
             InvalidAmountException: If amount is invalid
@@ -199,10 +355,11 @@ class CoffeeMachineService:
             )
         
         self.state.water_container.fill(amount)
-        self.state.last_updated = datetime.now()
+        self.state.last_updated_ns = time.time_ns()
+        self._invalidate_status()
         
-        # Persist state
-        self.storage.save_state(self.state)
+        # Persist state with the next save
+        self._dirty = True
         
         logger.info(
             "Water filled successfully",
@@ -211,15 +368,14 @@ class CoffeeMachineService:
         )
         
         # Broadcast status update to WebSocket clients
-        try:
-            status = self.get_status()
-            asyncio.create_task(manager.broadcast_status_update(status["data"]))
-        except Exception as e:
-            logger.warning("Failed to broadcast WebSocket message", error=str(e))
+        self._queue_broadcast("status")
         
         return {
             "success": True,
-            "message": f"Added {amount}ml of water. Container now at {self.state.water_container.current_amount}ml/{self.state.water_container.capacity}ml"
+            "container": "water",
+            "added": amount,
+            "current": self.state.water_container.current_amount,
+            "capacity": self.state.water_container.capacity
         }
     
     def fill_coffee(self, amount: float) -> dict:
@@ -230,7 +386,7 @@ class CoffeeMachineService:
             amount: Amount of coffee to add (grams)
             
         Returns:
-            Dictionary with success status and message
+            Dictionary with success status, amount added and the new coffee level
             
         Raises:
             InvalidAmountException: If amount is invalid
@@ -256,10 +412,11 @@ class CoffeeMachineService:
             )
         
         self.state.coffee_container.fill(amount)
-        self.state.last_updated = datetime.now()
+        self.state.last_updated_ns = time.time_ns()
+        self._invalidate_status()
         
-        # Persist state
-        self.storage.save_state(self.state)
+        # Persist state with the next save
+        self._dirty = True
         
         logger.info(
             "Coffee filled successfully",
@@ -268,15 +425,14 @@ class CoffeeMachineService:
         )
         
         # Broadcast status update to WebSocket clients
-        try:
-            status = self.get_status()
-            asyncio.create_task(manager.broadcast_status_update(status["data"]))
-        except Exception as e:
-            logger.warning("Failed to broadcast WebSocket message", error=str(e))
+        self._queue_broadcast("status")
         
         return {
             "success": True,
-            "message": f"Added {amount}g of coffee. Container now at {self.state.coffee_container.current_amount}g/{self.state.coffee_container.capacity}g"
+            "container": "coffee",
+            "added": amount,
+            "current": self.state.coffee_container.current_amount,
+            "capacity": self.state.coffee_container.capacity
         }
     
     def reset(self) -> dict:
@@ -292,12 +448,15 @@ class CoffeeMachineService:
         self.state = MachineState(
             water_container=WaterContainer(capacity=settings.water_capacity),
             coffee_container=CoffeeContainer(capacity=settings.coffee_capacity),
-            total_coffees_made=0,
-            last_updated=datetime.now()
+            total_coffees_made=0
         )
+        self._update_low_levels()
+        self._invalidate_status()
         
-        # Persist state
-        self.storage.save_state(self.state)
+        # Ask the save worker to persist the reset right away; it is the
+        # only writer, so an older snapshot cannot overwrite the reset
+        self._dirty = True
+        self._save_requested.set()
         
         logger.info("Machine reset successfully")
         
@@ -1,11 +1,23 @@
 """Storage layer for persisting machine state."""
-import json
+import hashlib
 import os
+import threading
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+import orjson
 from app.models import MachineState, WaterContainer, CoffeeContainer
 from app.config import get_settings
+from app.logger import logger
+
+
+@lru_cache(maxsize=1)
+def _default_template() -> Tuple[float, float]:
+    """Return the configured (water, coffee) capacities for a new state, read once."""
+    settings = get_settings()
+    return settings.water_capacity, settings.coffee_capacity
 
 
 class StorageInterface(ABC):
@@ -25,93 +37,150 @@ class StorageInterface(ABC):
 class JSONStorage(StorageInterface):
     """JSON file-based storage implementation."""
     
-    def __init__(self, file_path: str):
-        """Initialize JSON storage with file path."""
+    def __init__(self, file_path: str, durable: bool = True, pretty: bool = False):
+        """
+        Initialize JSON storage with file path.
+        
+        Args:
+            file_path: Path of the JSON state file
+            durable: Write through a temp file that is fsynced, then atomically
+                renamed, and fsync the directory so the save survives a power
+                loss; when False the file is overwritten in place without
+                fsync, which is cheaper but can leave a truncated file if the
+                process dies mid-write (dev/test only)
+            pretty: Indent the JSON for reading by hand; compact output is
+                about half the size
+        """
         self.file_path = file_path
+        self.durable = durable
+        self._dump_option = orjson.OPT_INDENT_2 if pretty else 0
+        # Digest of the file contents last read or written; saves of identical
+        # contents are skipped
+        self._last_hash: Optional[bytes] = None
+        # Saves may run in a worker thread; one write at a time
+        self._write_lock = threading.Lock()
+        # Parent directory is created on the first save only
+        self._dir_ensured = False
     
     def load_state(self) -> MachineState:
         """Load state from JSON file. Returns new state if file doesn't exist or is invalid."""
-        if not os.path.exists(self.file_path):
-            return self._create_default_state()
+        # Read under the write lock so the digest recorded below matches the
+        # file even when a save runs in another thread
+        with self._write_lock:
+            try:
+                with open(self.file_path, 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                return self._create_default_state()
+            content_hash = hashlib.blake2b(content, digest_size=16).digest()
+            hash_when_read = self._last_hash
         
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Deserialize containers
-            water_container = WaterContainer(**data.get("water_container", {}))
-            coffee_container = CoffeeContainer(**data.get("coffee_container", {}))
-            
-            # Handle datetime deserialization
-            last_updated_str = data.get("last_updated")
-            if isinstance(last_updated_str, str):
-                last_updated = datetime.fromisoformat(last_updated_str)
-            else:
-                last_updated = datetime.now()
-            
-            return MachineState(
-                water_container=water_container,
-                coffee_container=coffee_container,
-                total_coffees_made=data.get("total_coffees_made", 0),
-                last_updated=last_updated
-            )
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            # Log error and return default state
-            print(f"Error loading state from {self.file_path}: {e}. Creating new state.")
+            # Parsed and validated straight from bytes by Pydantic's core,
+            # without building an intermediate dict in Python
+            state = MachineState.model_validate_json(content)
+        except ValueError as e:
+            # Invalid JSON or contents (ValidationError is a ValueError)
+            logger.warning("Failed to load state, using defaults", path=self.file_path, error=str(e))
             return self._create_default_state()
+        with self._write_lock:
+            # Only record the digest if no save replaced the file meanwhile
+            if self._last_hash == hash_when_read:
+                self._last_hash = content_hash
+        return state
     
     def save_state(self, state: MachineState) -> None:
-        """Save state to JSON file atomically."""
-        # Create parent directories if needed
-        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-        
-        # Prepare data for serialization
+        """Save state to JSON file (atomically if durable), unless the file already holds it."""
+        # Only the containers' persistent fields are saved; percent_per_unit
+        # is derived from capacity on load
+        water = state.water_container
+        coffee = state.coffee_container
         data = {
-            "water_container": {
-                "capacity": state.water_container.capacity,
-                "current_amount": state.water_container.current_amount
-            },
-            "coffee_container": {
-                "capacity": state.coffee_container.capacity,
-                "current_amount": state.coffee_container.current_amount
-            },
+            "water_container": {"capacity": water.capacity, "current_amount": water.current_amount},
+            "coffee_container": {"capacity": coffee.capacity, "current_amount": coffee.current_amount},
             "total_coffees_made": state.total_coffees_made,
-            "last_updated": state.last_updated.isoformat()
+            # orjson writes datetimes in ISO 8601 format
+            "last_updated": state.last_updated
         }
         
-        # Atomic write: write to temp file, then rename
-        temp_path = f"{self.file_path}.tmp"
-        try:
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+        content = orjson.dumps(data, option=self._dump_option)
+        content_hash = hashlib.blake2b(content, digest_size=16).digest()
+        
+        with self._write_lock:
+            if content_hash == self._last_hash:
+                return
+            
+            # Create parent directories if needed (a bare file name has none)
+            if not self._dir_ensured:
+                directory = os.path.dirname(self.file_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._dir_ensured = True
             
-            # Rename (atomic on most filesystems)
-            os.replace(temp_path, self.file_path)
-        except Exception as e:
-            # Clean up temp file on error
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-            raise IOError(f"Failed to save state to {self.file_path}: {e}") from e
+            if not self.durable:
+                try:
+                    with open(self.file_path, 'wb') as f:
+                        f.write(content)
+                except OSError as e:
+                    raise IOError(f"Failed to save state to {self.file_path}: {e}") from e
+                self._last_hash = content_hash
+                return
+            
+            # Atomic write: write to temp file and flush it to disk, then rename
+            temp_path = f"{self.file_path}.tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                
+                # Rename (atomic on most filesystems)
+                os.replace(temp_path, self.file_path)
+                self._fsync_directory()
+                self._last_hash = content_hash
+            except Exception as e:
+                # Clean up temp file on error
+                Path(temp_path).unlink(missing_ok=True)
+                raise IOError(f"Failed to save state to {self.file_path}: {e}") from e
+    
+    def _fsync_directory(self) -> None:
+        """Flush the state file's directory entry so the rename is on disk."""
+        try:
+            fd = os.open(os.path.dirname(self.file_path) or ".", os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            # Some platforms cannot open or sync a directory (e.g. Windows);
+            # the file itself is already on disk
+            pass
     
     def _create_default_state(self) -> MachineState:
         """Create a new default machine state."""
-        settings = get_settings()
+        water_capacity, coffee_capacity = _default_template()
         return MachineState(
-            water_container=WaterContainer(capacity=settings.water_capacity),
-            coffee_container=CoffeeContainer(capacity=settings.coffee_capacity),
+            water_container=WaterContainer(capacity=water_capacity),
+            coffee_container=CoffeeContainer(capacity=coffee_capacity),
             total_coffees_made=0,
             last_updated=datetime.now()
         )
 
 
+@lru_cache(maxsize=4)
 def get_storage(storage_type: str, **kwargs) -> StorageInterface:
-    """Factory function to create storage instances."""
+    """
+    Factory function to create storage instances.
+    
+    Instances are cached per arguments, so every caller asking for the same
+    file shares one storage (and its write lock and last-saved digest).
+    """
     if storage_type == "json":
-        file_path = kwargs.get("file_path")
-        if not file_path:
-            settings = get_settings()
-            file_path = settings.data_path
-        return JSONStorage(file_path)
+        settings = get_settings()
+        file_path = kwargs.get("file_path") or settings.data_path
+        durable = kwargs.get("durable", settings.durable_writes)
+        pretty = kwargs.get("pretty", settings.pretty_json)
+        return JSONStorage(file_path, durable=durable, pretty=pretty)
     else:
         raise ValueError(f"Unsupported storage type: {storage_type}")
 
@@ -1,7 +1,13 @@
 """Input validation and sanitization utilities."""
-import re
 from typing import Any
 
+# Translation table deleting control characters (newlines and tabs are kept
+# for formatted text)
+_CTRL_TBL = dict.fromkeys([*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), *range(0x7f, 0xa0)])
+
+_VALID_COFFEE_TYPES = frozenset({"espresso", "double_espresso", "ristretto", "americano"})
+_VALID_COFFEE_TYPES_STR = ", ".join(sorted(_VALID_COFFEE_TYPES))
+
 
 class ValidationHelpers:
     """Helper class for input validation and sanitization."""
@@ -69,8 +75,12 @@ class ValidationHelpers:
         if len(value) > max_length:
             raise ValueError(f"String too long. Max: {max_length}")
         
+        # Printable ASCII has no control characters to remove
+        if value.isascii() and value.isprintable():
+            return value.strip()
+        
         # Remove control characters (keep newlines and tabs for formatted text)
-        sanitized = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', value)
+        sanitized = value.translate(_CTRL_TBL)
         
         return sanitized.strip()
     
@@ -96,12 +106,7 @@ class ValidationHelpers:
         if to_add <= 0:
             raise ValueError("Amount to add must be positive")
         
-        if to_add > capacity:
-            raise ValueError(
-                f"Cannot add {to_add} to {container_name}. "
-                f"Exceeds total capacity ({capacity})"
-            )
-        
+        # With current >= 0 this also rejects amounts above the whole capacity
         new_amount = current + to_add
         if new_amount > capacity:
             raise ValueError(
@@ -124,13 +129,13 @@ class ValidationHelpers:
         Raises:
             ValueError: If coffee type is invalid
         """
-        valid_types = ["espresso", "double_espresso", "ristretto", "americano"]
-        if value.lower() not in valid_types:
+        coffee_type = value.lower()
+        if coffee_type not in _VALID_COFFEE_TYPES:
             raise ValueError(
                 f"Invalid coffee type: {value}. "
-                f"Valid types: {', '.join(valid_types)}"
+                f"Valid types: {_VALID_COFFEE_TYPES_STR}"
             )
-        return value.lower()
+        return coffee_type
     
     @staticmethod
     def validate_percentage(value: float, field_name: str = "percentage") -> float:
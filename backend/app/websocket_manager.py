@@ -1,17 +1,56 @@
-"""WebSocket connection manager for real-time updates."""
-from typing import List, Dict, Any
+"""WebSocket connection manager for real-time updates.
+
+Messages are JSON documents sent as binary frames. Each message is encoded
+once and the same bytes are sent to every recipient; with no recipients it is
+not encoded at all. Broadcasts made within one event-loop tick are sent as a
+single ``{"type": "batch", "messages": [...]}`` frame, in the order they were
+made.
+"""
+import asyncio
+from contextlib import suppress
+from typing import Dict, Any, List, Optional, Tuple
+import orjson
 from fastapi import WebSocket
 from app.logger import logger
 from datetime import datetime
 
+# Client heartbeat: a single 0x01 byte (legacy clients send the text "ping")
+PING_FRAME = b"\x01"
+PONG_FRAME = orjson.dumps({"type": "pong"})
+
+# Timestamps of messages produced within this many loop seconds are shared
+TIMESTAMP_REUSE_WINDOW = 0.001
+_ts_cache: Optional[Tuple[float, str]] = None
+
+
+def _encode(messages: List[Dict[str, Any]]) -> bytes:
+    """Encode one message as itself and several as a batch frame."""
+    if len(messages) == 1:
+        return orjson.dumps(messages[0])
+    return orjson.dumps({"type": "batch", "messages": messages})
+
+
+def _now_iso() -> str:
+    """Return datetime.now().isoformat(), reused for back-to-back broadcasts."""
+    global _ts_cache
+    now = asyncio.get_running_loop().time()
+    if _ts_cache is None or now - _ts_cache[0] >= TIMESTAMP_REUSE_WINDOW:
+        _ts_cache = (now, datetime.now().isoformat())
+    return _ts_cache[1]
+
 
 class ConnectionManager:
     """Manages WebSocket connections and broadcasts messages to clients."""
     
     def __init__(self):
         """Initialize connection manager."""
-        self.active_connections: List[WebSocket] = []
+        # Connected clients and their metadata; insertion-ordered, O(1) removal
         self.connection_metadata: Dict[WebSocket, Dict[str, Any]] = {}
+        # (message, excluded connection) pairs waiting for the next flush, and
+        # the task that sends them
+        self._pending: List[Tuple[Dict[str, Any], Optional[WebSocket]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_scheduled = False
     
     async def connect(self, websocket: WebSocket, client_id: str = None):
         """
@@ -22,7 +61,6 @@ class ConnectionManager:
             client_id: Optional client identifier
         """
         await websocket.accept()
-        self.active_connections.append(websocket)
         self.connection_metadata[websocket] = {
             "client_id": client_id,
             "connected_at": datetime.now().isoformat(),
@@ -30,7 +68,7 @@ class ConnectionManager:
         logger.info(
             "WebSocket connected",
             client_id=client_id,
-            total_connections=len(self.active_connections)
+            total_connections=len(self.connection_metadata)
         )
     
     def disconnect(self, websocket: WebSocket):
@@ -40,13 +78,12 @@ class ConnectionManager:
         Args:
             websocket: WebSocket connection to remove
         """
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            metadata = self.connection_metadata.pop(websocket, {})
+        metadata = self.connection_metadata.pop(websocket, None)
+        if metadata is not None:
             logger.info(
                 "WebSocket disconnected",
                 client_id=metadata.get("client_id"),
-                total_connections=len(self.active_connections)
+                total_connections=len(self.connection_metadata)
             )
     
     async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
@@ -57,8 +94,18 @@ class ConnectionManager:
             message: Message to send
             websocket: Target WebSocket connection
         """
+        await self.send_frame(orjson.dumps(message), websocket)
+    
+    async def send_frame(self, frame: bytes, websocket: WebSocket):
+        """
+        Send a pre-encoded frame to a specific client.
+        
+        Args:
+            frame: Encoded message
+            websocket: Target WebSocket connection
+        """
         try:
-            await websocket.send_json(message)
+            await websocket.send_bytes(frame)
         except Exception as e:
             logger.error("Error sending message to client", error=str(e))
             self.disconnect(websocket)
@@ -67,23 +114,92 @@ class ConnectionManager:
         """
         Broadcast a message to all connected clients.
         
+        Messages are queued and sent on the next event-loop iteration, together
+        with any other broadcasts made in the meantime, so every client gets
+        them in the order they were made.
+        
         Args:
             message: Message to broadcast
             exclude: WebSocket connection to exclude from broadcast
         """
-        disconnected = []
-        for connection in self.active_connections:
-            if connection == exclude:
-                continue
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error("Error broadcasting to client", error=str(e))
-                disconnected.append(connection)
+        # Nothing to encode when nobody is listening
+        if not self.connection_metadata:
+            return
+        self._pending.append((message, exclude))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._flush_task = asyncio.ensure_future(self._flush(self._flush_task))
+    
+    async def _flush(self, previous: Optional[asyncio.Task]) -> None:
+        """
+        Send pending broadcasts as one frame, after the previous flush finished.
+        
+        Args:
+            previous: Flush task still sending earlier messages, kept in order
+        """
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        pending, self._pending = self._pending, []
+        self._flush_scheduled = False
+        try:
+            frame = _encode([message for message, _ in pending])
+            excluded = {exclude for _, exclude in pending if exclude is not None}
+            if not excluded:
+                await self.broadcast_bytes(frame)
+                return
+            # Excluded clients get their own frame without the messages
+            # that skip them; everyone else shares the full frame
+            sends = []
+            for conn in self.connection_metadata:
+                if conn in excluded:
+                    messages = [message for message, exclude in pending if exclude is not conn]
+                    if messages:
+                        sends.append((conn, _encode(messages)))
+                else:
+                    sends.append((conn, frame))
+            await self._send_all(sends)
+        except Exception as e:
+            logger.error("Error flushing broadcasts", error=str(e))
+    
+    async def close(self) -> None:
+        """Stop the pending broadcast flush, if any; called on shutdown."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flush_task
+    
+    async def broadcast_bytes(self, frame: bytes, exclude: WebSocket = None):
+        """
+        Send a pre-encoded frame to all connected clients concurrently.
+        
+        A slow client no longer delays the ones after it; clients whose send
+        fails are disconnected once every send has finished.
+        
+        Args:
+            frame: Encoded message
+            exclude: WebSocket connection to exclude from broadcast
+        """
+        await self._send_all([
+            (conn, frame) for conn in self.connection_metadata if conn is not exclude
+        ])
+    
+    async def _send_all(self, sends: List[Tuple[WebSocket, bytes]]) -> None:
+        """
+        Send each frame to its client concurrently, disconnecting failed clients.
+        
+        Args:
+            sends: (connection, frame) pairs
+        """
+        results = await asyncio.gather(
+            *(conn.send_bytes(frame) for conn, frame in sends),
+            return_exceptions=True
+        )
         
         # Clean up disconnected clients
-        for conn in disconnected:
-            self.disconnect(conn)
+        for (conn, _), result in zip(sends, results):
+            if isinstance(result, Exception):
+                logger.error("Error broadcasting to client", error=str(result))
+                self.disconnect(conn)
     
     async def broadcast_status_update(self, status: Dict[str, Any]):
         """
@@ -95,7 +211,7 @@ class ConnectionManager:
         message = {
             "type": "status_update",
             "data": status,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _now_iso()
         }
         await self.broadcast(message)
     
@@ -111,7 +227,7 @@ class ConnectionManager:
             "type": "coffee_made",
             "coffee_type": coffee_type,
             "resources_used": resources_used,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _now_iso()
         }
         await self.broadcast(message)
     
@@ -127,7 +243,7 @@ class ConnectionManager:
             "type": "error",
             "error_type": error_type,
             "message": error_message,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _now_iso()
         }
         await self.broadcast(message)
     
@@ -139,7 +255,7 @@ class ConnectionManager:
             Dictionary with connection statistics
         """
         return {
-            "total_connections": len(self.active_connections),
+            "total_connections": len(self.connection_metadata),
             "connections": [
                 {
                     "client_id": meta.get("client_id"),
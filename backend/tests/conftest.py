@@ -0,0 +1,8 @@
+"""Shared pytest configuration for the backend tests."""
+# Import the application modules once per worker before any test file is
+# collected, so Pydantic model classes (and their core validators) are built
+# up front rather than during the first test that touches them
+import app.exceptions  # noqa: F401
+import app.models  # noqa: F401
+import app.services  # noqa: F401
+import app.storage  # noqa: F401
@@ -1,8 +1,9 @@
 """Tests for API endpoints."""
 import pytest
 from fastapi.testclient import TestClient
-from datetime import datetime
 from app.main import app
+from app.dependencies import get_service, get_health_checker
+from app.health import HealthChecker
 from app.models import MachineState, WaterContainer, CoffeeContainer
 from app.storage import StorageInterface
 from app.services import CoffeeMachineService
@@ -12,11 +13,10 @@ class MockStorageForAPI(StorageInterface):
     """Mock storage for API testing."""
     
     def __init__(self):
-        self.state = MachineState(
+        self.state = MachineState.model_construct(
             water_container=WaterContainer(current_amount=1000.0, capacity=2000.0),
             coffee_container=CoffeeContainer(current_amount=500.0, capacity=500.0),
-            total_coffees_made=0,
-            last_updated=datetime.now()
+            total_coffees_made=0
         )
     
     def load_state(self) -> MachineState:
@@ -26,19 +26,26 @@ class MockStorageForAPI(StorageInterface):
         self.state = state
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def client():
-    """Create test client with dependency override."""
-    from app.main import get_service
-    
-    # Create mock storage and service
-    mock_storage = MockStorageForAPI()
-    mock_service = CoffeeMachineService(mock_storage)
-    
-    # Override dependency
-    app.dependency_overrides[get_service] = lambda: mock_service
+    """Create one test client shared by every test in the module."""
+    return TestClient(app)
+
+
+@pytest.fixture
+def service():
+    """Create a fresh mock-backed service for each test."""
+    return CoffeeMachineService(MockStorageForAPI())
+
+
+@pytest.fixture(autouse=True)
+def override_dependencies(service):
+    """Point the app's dependencies at this test's service and storage."""
+    health_checker = HealthChecker(service.storage, service=service)
+    app.dependency_overrides[get_service] = lambda: service
+    app.dependency_overrides[get_health_checker] = lambda: health_checker
     
-    yield TestClient(app)
+    yield
     
     # Clean up
     app.dependency_overrides.clear()
@@ -96,22 +103,16 @@ class TestCoffeeEndpoints:
         data = response.json()
         assert data["success"] is True
     
-    def test_make_espresso_with_insufficient_resources(self, client):
+    def test_make_espresso_with_insufficient_resources(self, client, service):
         """Test making espresso with insufficient resources."""
-        # Override to have no water
-        from app.main import get_service
-        mock_storage = MockStorageForAPI()
-        mock_storage.state.water_container.current_amount = 10.0
-        mock_service = CoffeeMachineService(mock_storage)
-        app.dependency_overrides[get_service] = lambda: mock_service
+        # Not enough water
+        service.state.water_container.current_amount = 10.0
         
         response = client.post("/api/coffee/espresso")
         assert response.status_code == 409
         data = response.json()
         assert data["success"] is False
         assert "water" in data["message"].lower()
-        
-        app.dependency_overrides.clear()
 
 
 class TestFillEndpoints:
@@ -123,39 +124,27 @@ class TestFillEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert data["success"] is True
-        assert "water" in data["message"].lower()
+        assert data["container"] == "water"
     
-    def test_fill_coffee(self, client):
+    def test_fill_coffee(self, client, service):
         """Test filling coffee container."""
         # Need to reduce coffee first
-        from app.main import get_service
-        mock_storage = MockStorageForAPI()
-        mock_storage.state.coffee_container.current_amount = 300.0
-        mock_service = CoffeeMachineService(mock_storage)
-        app.dependency_overrides[get_service] = lambda: mock_service
+        service.state.coffee_container.current_amount = 300.0
         
         response = client.post("/api/fill/coffee", json={"amount": 100.0})
         assert response.status_code == 200
         data = response.json()
         assert data["success"] is True
-        assert "coffee" in data["message"].lower()
-        
-        app.dependency_overrides.clear()
+        assert data["container"] == "coffee"
     
-    def test_fill_water_overflow(self, client):
+    def test_fill_water_overflow(self, client, service):
         """Test water fill overflow."""
-        from app.main import get_service
-        mock_storage = MockStorageForAPI()
-        mock_storage.state.water_container.current_amount = 1800.0
-        mock_service = CoffeeMachineService(mock_storage)
-        app.dependency_overrides[get_service] = lambda: mock_service
+        service.state.water_container.current_amount = 1800.0
         
         response = client.post("/api/fill/water", json={"amount": 500.0})
         assert response.status_code == 409
         data = response.json()
         assert data["success"] is False
-        
-        app.dependency_overrides.clear()
     
     def test_fill_invalid_amount(self, client):
         """Test fill with invalid (negative) amount."""
@@ -1,6 +1,7 @@
 """Tests for configuration module."""
 import pytest
-from app.config import Settings, get_settings
+import dataclasses
+from app.config import RuntimeConfig, Settings, get_settings
 
 
 class TestSettings:
@@ -34,3 +35,41 @@ class TestSettings:
         settings2 = get_settings()
         assert settings1 is settings2
 
+    def test_cors_origins_set_is_parsed_once(self):
+        """Test that CORS origins are split, stripped and cached."""
+        settings = Settings(cors_origins="http://a.test, http://b.test")
+        assert settings.cors_origins_set == frozenset({"http://a.test", "http://b.test"})
+        assert settings.cors_origins_set is settings.cors_origins_set
+        assert settings.cors_allow_all is False
+
+    def test_cors_origins_set_ignores_empty_entries(self):
+        """Test that stray commas do not produce an empty origin."""
+        settings = Settings(cors_origins="http://a.test,, http://b.test,")
+        assert settings.cors_origins_set == frozenset({"http://a.test", "http://b.test"})
+
+    def test_cors_wildcard_allows_all(self):
+        """Test that the * wildcard is detected."""
+        assert Settings(cors_origins="*").cors_allow_all is True
+
+
+class TestRuntimeConfig:
+    """Test RuntimeConfig settings snapshot."""
+
+    def test_from_settings_parses_cors_origins(self):
+        """Test that CORS origins are split and stripped once."""
+        settings = Settings(cors_origins="http://a.test, http://b.test")
+        runtime = RuntimeConfig.from_settings(settings)
+        assert runtime.cors_origins_set == frozenset({"http://a.test", "http://b.test"})
+
+    def test_from_settings_builds_container_config(self):
+        """Test that container config reflects effective capacities."""
+        settings = Settings(custom_water_capacity=1500.0)
+        runtime = RuntimeConfig.from_settings(settings)
+        assert runtime.container_config["custom_water_capacity"] == 1500.0
+        assert runtime.container_config["effective_water_capacity"] == 1500.0
+
+    def test_runtime_config_is_frozen(self):
+        """Test that the snapshot cannot be reassigned."""
+        runtime = RuntimeConfig.from_settings(Settings())
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            runtime.cors_origins_set = frozenset()
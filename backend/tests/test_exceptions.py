@@ -6,6 +6,7 @@ from app.exceptions import (
     InsufficientResourcesException,
     ContainerOverflowException,
     InvalidAmountException,
+    RateLimitExceededException,
     exception_handler
 )
 
@@ -46,6 +47,13 @@ class TestCustomExceptions:
         assert exc.reason == "Cannot be negative"
         assert exc.status_code == 400
 
+    def test_rate_limit_exceeded_exception(self):
+        """Test RateLimitExceededException."""
+        exc = RateLimitExceededException(20, 60, 30)
+        assert exc.status_code == 429
+        assert exc.to_dict()["details"]["retry_after"] == 30
+        assert exc.headers["Retry-After"] == "30"
+
     def test_exception_handler(self):
         """Test exception handler converts exceptions to HTTP responses."""
         exc = InsufficientResourcesException("water", 100.0, 50.0)
@@ -0,0 +1,225 @@
+"""Tests for health checks."""
+import asyncio
+import time
+import pytest
+from app import health as health_module
+from app.health import HealthChecker
+from app.models import MachineState, WaterContainer, CoffeeContainer
+from app.services import CoffeeMachineService
+from app.storage import StorageInterface
+
+
+class CountingStorage(StorageInterface):
+    """Mock storage that counts loads."""
+    
+    def __init__(self):
+        self.state = MachineState.model_construct(
+            water_container=WaterContainer(current_amount=1000.0, capacity=2000.0),
+            coffee_container=CoffeeContainer(current_amount=250.0, capacity=500.0),
+            total_coffees_made=0
+        )
+        self.load_count = 0
+    
+    def load_state(self) -> MachineState:
+        self.load_count += 1
+        return self.state
+    
+    def save_state(self, state: MachineState) -> None:
+        self.state = state
+
+
+class TestHealthChecker:
+    """Test HealthChecker."""
+    
+    @pytest.mark.asyncio
+    async def test_result_is_reused_within_probe_interval(self):
+        """Test that probes run once per interval."""
+        storage = CountingStorage()
+        checker = HealthChecker(storage, probe_interval=60.0)
+        
+        first = await checker.check_health()
+        loads = storage.load_count
+        second = await checker.check_health()
+        
+        assert second["status"] == first["status"]
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert storage.load_count == loads
+    
+    @pytest.mark.asyncio
+    async def test_uptime_is_reported_in_seconds(self):
+        """Test that uptime is measured from the monotonic start time."""
+        checker = HealthChecker(CountingStorage(), probe_interval=0.0)
+        checker.start_time -= 90.0
+        
+        health = await checker.check_health()
+        
+        assert health["uptime"].startswith("90.")
+        assert health["uptime"].endswith("s")
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_checks_share_one_refresh(self):
+        """Test that simultaneous callers trigger a single probe run."""
+        storage = CountingStorage()
+        checker = HealthChecker(storage, probe_interval=60.0)
+        
+        results = await asyncio.gather(*(checker.check_health() for _ in range(5)))
+        loads = storage.load_count
+        await checker.check_health()
+        
+        assert [r["cached"] for r in results].count(False) == 1
+        assert storage.load_count == loads
+    
+    @pytest.mark.asyncio
+    async def test_zero_interval_probes_every_time(self):
+        """Test that a zero interval disables caching."""
+        storage = CountingStorage()
+        checker = HealthChecker(storage, probe_interval=0.0)
+        
+        await checker.check_health()
+        loads = storage.load_count
+        await checker.check_health()
+        
+        assert storage.load_count > loads
+    
+    @pytest.mark.asyncio
+    async def test_failing_check_is_reported_unhealthy(self, monkeypatch):
+        """Test that an exception in one check does not abort the others."""
+        checker = HealthChecker(CountingStorage(), probe_interval=0.0)
+        
+        def broken():
+            raise RuntimeError("probe crashed")
+        
+        monkeypatch.setattr(checker, "_check_system_resources", broken)
+        health = await checker.check_health()
+        
+        assert health["status"] == "unhealthy"
+        assert health["checks"]["system"] == {"status": "unhealthy", "message": "probe crashed"}
+        assert health["checks"]["storage"]["status"] == "healthy"
+    
+    @pytest.mark.asyncio
+    async def test_slow_check_times_out_as_degraded(self, monkeypatch):
+        """Test that a check exceeding the timeout degrades overall status."""
+        checker = HealthChecker(CountingStorage(), probe_interval=0.0, check_timeout=0.05)
+        
+        def hung():
+            time.sleep(0.5)
+            return checker.storage.state
+        
+        monkeypatch.setattr(checker.storage, "load_state", hung)
+        monkeypatch.setattr(health_module, "_last_cpu_percent", 0.0)
+        health = await checker.check_health()
+        
+        assert health["checks"]["storage"] == {"status": "unhealthy", "message": "timeout"}
+        assert health["checks"]["machine"] == {"status": "unhealthy", "message": "timeout"}
+        assert health["status"] == "degraded"
+    
+    @pytest.mark.asyncio
+    async def test_slow_system_check_times_out_as_degraded(self, monkeypatch):
+        """Test that a hung psutil read degrades rather than fails the system."""
+        checker = HealthChecker(CountingStorage(), probe_interval=0.0, check_timeout=0.05)
+        
+        def hung():
+            time.sleep(0.5)
+            return {"status": "healthy"}
+        
+        monkeypatch.setattr(checker, "_check_system_resources", hung)
+        health = await checker.check_health()
+        
+        assert health["checks"]["system"] == {"status": "unhealthy", "message": "timeout"}
+        assert health["status"] == "degraded"
+    
+    @pytest.mark.asyncio
+    async def test_state_is_loaded_once_per_check(self):
+        """Test that storage and machine checks share a single state load."""
+        storage = CountingStorage()
+        checker = HealthChecker(storage, probe_interval=0.0)
+        
+        health = await checker.check_health()
+        
+        assert storage.load_count == 1
+        assert health["checks"]["machine"]["total_coffees_made"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_storage_failure_fails_storage_and_machine_checks(self, monkeypatch):
+        """Test that a failed load is reported once for both dependent checks."""
+        checker = HealthChecker(CountingStorage(), probe_interval=0.0)
+        
+        def broken():
+            raise IOError("disk gone")
+        
+        monkeypatch.setattr(checker.storage, "load_state", broken)
+        health = await checker.check_health()
+        
+        assert health["status"] == "unhealthy"
+        assert health["checks"]["storage"]["message"] == "Storage error: disk gone"
+        assert health["checks"]["machine"] == health["checks"]["storage"]
+    
+    @pytest.mark.asyncio
+    async def test_machine_check_reads_live_service_state(self):
+        """Test that the machine check reports the in-memory state, not the saved one."""
+        storage = CountingStorage()
+        service = CoffeeMachineService(storage, storage.state.model_copy(deep=True))
+        service.state.total_coffees_made = 7
+        checker = HealthChecker(storage, probe_interval=0.0, service=service)
+        
+        health = await checker.check_health()
+        
+        assert storage.load_count == 1
+        assert health["checks"]["machine"]["total_coffees_made"] == 7
+    
+    @pytest.mark.asyncio
+    async def test_storage_failure_leaves_live_machine_check(self, monkeypatch):
+        """Test that with a service, a storage failure only fails the storage check."""
+        storage = CountingStorage()
+        checker = HealthChecker(storage, probe_interval=0.0, service=CoffeeMachineService(storage))
+        
+        def broken():
+            raise IOError("disk gone")
+        
+        monkeypatch.setattr(storage, "load_state", broken)
+        health = await checker.check_health()
+        
+        assert health["checks"]["storage"]["message"] == "Storage error: disk gone"
+        assert health["checks"]["machine"]["status"] == "healthy"
+    
+    @pytest.mark.asyncio
+    async def test_system_check_uses_background_cpu_sample(self, monkeypatch):
+        """Test that the system check reads the sampled CPU value."""
+        monkeypatch.setattr("app.health._last_cpu_percent", 42.0)
+        checker = HealthChecker(CountingStorage(), probe_interval=0.0)
+        
+        health = await checker.check_health()
+        
+        assert health["checks"]["system"]["cpu_percent"] == 42.0
+    
+    def test_memory_and_disk_readings_are_reused(self, monkeypatch):
+        """Test that psutil memory/disk readings are cached within the TTL."""
+        monkeypatch.setattr(health_module, "_system_readings", None)
+        first = health_module._read_memory_and_disk()
+        second = health_module._read_memory_and_disk()
+        
+        assert first[0] is second[0]
+        assert first[1] is second[1]
+    
+    @pytest.mark.asyncio
+    async def test_unknown_system_status_degrades_overall(self, monkeypatch):
+        """Test that an inconclusive resource check counts as degraded."""
+        checker = HealthChecker(CountingStorage(), probe_interval=0.0)
+        monkeypatch.setattr(checker, "_check_system_resources", lambda: {"status": "unknown"})
+        
+        health = await checker.check_health()
+        
+        assert health["status"] == "degraded"
+    
+    @pytest.mark.asyncio
+    async def test_etag_is_stable_across_cached_results(self):
+        """Test that cached copies keep the ETag of the result they came from."""
+        checker = HealthChecker(CountingStorage(), probe_interval=60.0)
+        
+        await checker.check_health()
+        etag = checker.etag
+        await checker.check_health()
+        
+        assert etag.startswith('W/"')
+        assert checker.etag == etag
@@ -0,0 +1,24 @@
+"""Tests for request middleware."""
+import re
+from app import middleware
+from app.middleware import new_request_id
+
+
+class TestRequestId:
+    """Test pooled request ID generation."""
+
+    def test_request_id_is_eight_hex_chars(self):
+        """Test that request IDs are 8 lowercase hex characters."""
+        assert re.fullmatch(r"[0-9a-f]{8}", new_request_id())
+
+    def test_request_ids_are_unique(self):
+        """Test that consecutive request IDs differ."""
+        ids = {new_request_id() for _ in range(100)}
+        assert len(ids) == 100
+
+    def test_pool_is_refilled_when_exhausted(self):
+        """Test that IDs keep coming after the pool is used up."""
+        count = middleware._REQUEST_ID_POOL_SIZE // 4 + 10
+        ids = [new_request_id() for _ in range(count)]
+        assert all(len(request_id) == 8 for request_id in ids)
+        assert middleware._request_id_offset <= middleware._REQUEST_ID_POOL_SIZE
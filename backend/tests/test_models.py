@@ -14,70 +14,79 @@ from app.models import (
     ErrorResponse
 )
 
+# Fixed timestamp (with microseconds) so tests are deterministic
+FIXED_NOW = datetime(2024, 1, 1, 12, 0, 0, 123456)
 
-class TestWaterContainer:
-    """Test WaterContainer model."""
-
-    def test_can_dispense_with_sufficient_water(self):
-        """Test that can_dispense returns True when water is sufficient."""
-        container = WaterContainer(current_amount=100.0, capacity=2000.0)
-        assert container.can_dispense(50.0) is True
-        assert container.can_dispense(100.0) is True
-
-    def test_cannot_dispense_with_insufficient_water(self):
-        """Test that can_dispense returns False when water is insufficient."""
-        container = WaterContainer(current_amount=50.0, capacity=2000.0)
-        assert container.can_dispense(100.0) is False
-
-    def test_can_fill_within_capacity(self):
-        """Test that can_fill returns True when within capacity."""
-        container = WaterContainer(current_amount=100.0, capacity=2000.0)
-        assert container.can_fill(500.0) is True
-        assert container.can_fill(1900.0) is True
-
-    def test_cannot_fill_beyond_capacity(self):
-        """Test that can_fill returns False when beyond capacity."""
-        container = WaterContainer(current_amount=100.0, capacity=2000.0)
-        assert container.can_fill(2000.0) is False  # Would exceed
-        assert container.can_fill(3000.0) is False
-
-    def test_dispense_reduces_amount(self):
+
+@pytest.mark.parametrize(
+    "container_cls,capacity,unit",
+    [(WaterContainer, 2000.0, "ml"), (CoffeeContainer, 500.0, "g")]
+)
+class TestContainer:
+    """Test container behaviour shared by WaterContainer and CoffeeContainer."""
+
+    def test_defaults(self, container_cls, capacity, unit):
+        """Test default capacity, empty start and unit."""
+        container = container_cls()
+        assert container.capacity == capacity
+        assert container.current_amount == 0.0
+        assert container.unit == unit
+
+    def test_can_dispense(self, container_cls, capacity, unit):
+        """Test that can_dispense compares against the current amount."""
+        container = container_cls(current_amount=capacity * 0.5, capacity=capacity)
+        assert container.can_dispense(capacity * 0.25) is True
+        assert container.can_dispense(capacity * 0.5) is True
+        assert container.can_dispense(capacity * 0.6) is False
+
+    def test_can_fill(self, container_cls, capacity, unit):
+        """Test that can_fill allows filling up to capacity and no further."""
+        container = container_cls(current_amount=capacity * 0.05, capacity=capacity)
+        assert container.can_fill(capacity * 0.95) is True
+        assert container.can_fill(capacity) is False  # Would exceed
+        assert container.can_fill(capacity * 1.5) is False
+
+    def test_dispense_reduces_amount(self, container_cls, capacity, unit):
         """Test that dispense reduces the current amount."""
-        container = WaterContainer(current_amount=100.0, capacity=2000.0)
+        container = container_cls(current_amount=100.0, capacity=capacity)
         container.dispense(50.0)
         assert container.current_amount == 50.0
 
-    def test_fill_increases_amount(self):
+    def test_fill_increases_amount(self, container_cls, capacity, unit):
         """Test that fill increases the current amount."""
-        container = WaterContainer(current_amount=100.0, capacity=2000.0)
-        container.fill(500.0)
-        assert container.current_amount == 600.0
+        container = container_cls(current_amount=100.0, capacity=capacity)
+        container.fill(300.0)
+        assert container.current_amount == 400.0
 
-    def test_cannot_have_negative_amount(self):
+    def test_cannot_have_negative_amount(self, container_cls, capacity, unit):
         """Test that current_amount cannot be negative."""
-        with pytest.raises(ValidationError):
-            WaterContainer(current_amount=-10.0, capacity=2000.0)
+        with pytest.raises(ValueError):
+            container_cls(current_amount=-10.0, capacity=capacity)
 
-    def test_cannot_exceed_capacity(self):
+    def test_cannot_exceed_capacity(self, container_cls, capacity, unit):
         """Test that current_amount cannot exceed capacity."""
-        with pytest.raises(ValidationError):
-            WaterContainer(current_amount=3000.0, capacity=2000.0)
+        with pytest.raises(ValueError):
+            container_cls(current_amount=capacity + 1000.0, capacity=capacity)
 
+    def test_percent_per_unit(self, container_cls, capacity, unit):
+        """Test that the reciprocal turns an amount into a fill percentage."""
+        container = container_cls(current_amount=capacity / 4, capacity=capacity)
+        assert container.current_amount * container.percent_per_unit == 25.0
 
-class TestCoffeeContainer:
-    """Test CoffeeContainer model (same as WaterContainer)."""
+    def test_percent_per_unit_with_zero_capacity(self, container_cls, capacity, unit):
+        """Test that a zero-capacity container reports 0% instead of dividing by zero."""
+        assert container_cls(current_amount=0.0, capacity=0.0).percent_per_unit == 0.0
 
-    def test_can_dispense_with_sufficient_coffee(self):
-        """Test coffee container dispense logic."""
-        container = CoffeeContainer(current_amount=50.0, capacity=500.0)
-        assert container.can_dispense(30.0) is True
-        assert container.can_dispense(70.0) is False
+    def test_dispense_beyond_amount_raises(self, container_cls, capacity, unit):
+        """Test that dispense refuses more than the container holds."""
+        container = container_cls(current_amount=10.0, capacity=capacity)
+        with pytest.raises(ValueError, match=f"only 10.0{unit} available"):
+            container.dispense(20.0)
+        assert container.current_amount == 10.0
 
-    def test_cannot_fill_beyond_capacity(self):
-        """Test coffee container fill logic."""
-        container = CoffeeContainer(current_amount=100.0, capacity=500.0)
-        assert container.can_fill(400.0) is True
-        assert container.can_fill(500.0) is False
+    def test_container_has_no_instance_dict(self, container_cls, capacity, unit):
+        """Test that containers are slotted."""
+        assert not hasattr(container_cls(), "__dict__")
 
 
 class TestMachineState:
@@ -91,26 +100,72 @@ class TestMachineState:
             water_container=water,
             coffee_container=coffee,
             total_coffees_made=10,
-            last_updated=datetime.now()
+            last_updated=FIXED_NOW
         )
         assert state.total_coffees_made == 10
         assert state.water_container.current_amount == 100.0
         assert state.coffee_container.current_amount == 50.0
 
+    def test_does_not_coerce_field_types(self):
+        """Test that strict validation rejects a string where an int is expected."""
+        with pytest.raises(ValidationError):
+            MachineState(
+                water_container=WaterContainer(),
+                coffee_container=CoffeeContainer(),
+                total_coffees_made="10"
+            )
+
+    def test_accepts_nested_container_dicts(self):
+        """Test that containers can be given as dicts of their fields."""
+        state = MachineState.model_validate({
+            "water_container": {"capacity": 2000.0, "current_amount": 100.0},
+            "coffee_container": {"capacity": 500.0, "current_amount": 50.0},
+            "total_coffees_made": 3
+        })
+        assert state.water_container == WaterContainer(current_amount=100.0)
+        assert state.coffee_container == CoffeeContainer(current_amount=50.0)
+
+    def test_nested_container_dicts_are_bounds_checked(self):
+        """Test that container dicts still go through the container's bounds check."""
+        with pytest.raises(ValidationError, match="cannot be negative"):
+            MachineState.model_validate({
+                "water_container": {"capacity": 2000.0, "current_amount": -1.0},
+                "coffee_container": {}
+            })
+
     def test_serialization(self):
         """Test that MachineState can be serialized to dict."""
         water = WaterContainer(current_amount=100.0, capacity=2000.0)
         coffee = CoffeeContainer(current_amount=50.0, capacity=500.0)
-        state = MachineState(
+        state = MachineState.model_construct(
             water_container=water,
             coffee_container=coffee,
-            total_coffees_made=10,
-            last_updated=datetime.now()
+            total_coffees_made=10
         )
         data = state.model_dump()
         assert isinstance(data, dict)
         assert data["total_coffees_made"] == 10
 
+    def test_last_updated_round_trips_through_nanoseconds(self):
+        """Test that a last_updated datetime is stored as epoch ns and read back unchanged."""
+        now = FIXED_NOW
+        state = MachineState(
+            water_container=WaterContainer(),
+            coffee_container=CoffeeContainer(),
+            last_updated=now
+        )
+        assert isinstance(state.last_updated_ns, int)
+        assert state.last_updated == now
+
+    def test_last_updated_accepts_iso_string(self):
+        """Test that the ISO 8601 form used in state files is accepted."""
+        state = MachineState(
+            water_container=WaterContainer(),
+            coffee_container=CoffeeContainer(),
+            last_updated=FIXED_NOW.isoformat()
+        )
+        assert state.last_updated == FIXED_NOW
+
 
 class TestCoffeeType:
     """Test CoffeeType enum."""
@@ -127,23 +182,18 @@ class TestCoffeeType:
         assert CoffeeType.DOUBLE_ESPRESSO in RECIPES
         assert CoffeeType.AMERICANO in RECIPES
 
-    def test_espresso_recipe(self):
-        """Test espresso recipe values."""
-        recipe = RECIPES[CoffeeType.ESPRESSO]
-        assert recipe["coffee"] == 8
-        assert recipe["water"] == 24
+    def test_every_coffee_type_has_a_recipe(self):
+        """Test that make_coffee can index RECIPES for any CoffeeType."""
+        assert set(RECIPES) == set(CoffeeType)
 
-    def test_double_espresso_recipe(self):
-        """Test double espresso recipe values."""
-        recipe = RECIPES[CoffeeType.DOUBLE_ESPRESSO]
-        assert recipe["coffee"] == 16
-        assert recipe["water"] == 48
-
-    def test_americano_recipe(self):
-        """Test americano recipe values."""
-        recipe = RECIPES[CoffeeType.AMERICANO]
-        assert recipe["coffee"] == 16
-        assert recipe["water"] == 148
+    @pytest.mark.parametrize("coffee_type,coffee,water", [
+        (CoffeeType.ESPRESSO, 8, 24),
+        (CoffeeType.DOUBLE_ESPRESSO, 16, 48),
+        (CoffeeType.AMERICANO, 16, 148),
+    ])
+    def test_recipe_values(self, coffee_type, coffee, water):
+        """Test each recipe's (coffee, water) values."""
+        assert RECIPES[coffee_type] == (coffee, water)
 
 
 class TestRequestModels:
@@ -163,6 +213,20 @@ class TestRequestModels:
         with pytest.raises(ValidationError):
             FillRequest(amount=0.0)
 
+        # Invalid: more than a single fill allows
+        with pytest.raises(ValidationError):
+            FillRequest(amount=10001.0)
+        assert FillRequest(amount=10000.0).amount == 10000.0
+
+    def test_api_models_ignore_extra_fields_and_are_frozen(self):
+        """Test that unknown fields are dropped and responses cannot be changed."""
+        request = FillRequest(amount=1.0, unit="ml")
+        assert not hasattr(request, "unit")
+
+        response = MessageResponse(success=True, message="Test message")
+        with pytest.raises(ValidationError):
+            response.message = "changed"
+
     def test_message_response(self):
         """Test MessageResponse model."""
         response = MessageResponse(success=True, message="Test message")
@@ -0,0 +1,278 @@
+"""Tests for rate limiting."""
+import pytest
+from starlette.requests import Request
+from app.rate_limiter import (
+    LocalPreFilter,
+    MemoryRateLimitBackend,
+    RedisRateLimitBackend,
+    SlidingWindowRateLimiter,
+    _pack_address,
+    get_remote_address_with_proxy,
+)
+
+
+def make_request(headers=None, client=("10.0.0.1", 1234)) -> Request:
+    """Build a bare HTTP request with the given headers and client."""
+    return Request({
+        "type": "http",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": client,
+    })
+
+
+class TestMemoryRateLimitBackend:
+    """Test in-process sliding-window backend."""
+
+    @pytest.mark.asyncio
+    async def test_allows_requests_up_to_limit(self):
+        """Test that hits are allowed until the limit is reached."""
+        backend = MemoryRateLimitBackend()
+        results = [(await backend.hit(b"key", 3, 60_000)).allowed for _ in range(4)]
+        assert results == [True, True, True, False]
+
+    @pytest.mark.asyncio
+    async def test_keys_are_limited_independently(self):
+        """Test that each key has its own window."""
+        backend = MemoryRateLimitBackend()
+        assert (await backend.hit(b"a", 1, 60_000)).allowed is True
+        assert (await backend.hit(b"a", 1, 60_000)).allowed is False
+        assert (await backend.hit(b"b", 1, 60_000)).allowed is True
+
+    @pytest.mark.asyncio
+    async def test_expired_hits_leave_the_window(self):
+        """Test that hits older than the window no longer count."""
+        backend = MemoryRateLimitBackend()
+        assert (await backend.hit(b"key", 1, 0)).allowed is True
+        assert (await backend.hit(b"key", 1, 0)).allowed is True
+
+    @pytest.mark.asyncio
+    async def test_reports_remaining_and_reset(self):
+        """Test that hits report remaining budget and when the window frees up."""
+        backend = MemoryRateLimitBackend()
+        first = await backend.hit(b"key", 2, 60_000)
+        assert first.remaining == 1
+        await backend.hit(b"key", 2, 60_000)
+        denied = await backend.hit(b"key", 2, 60_000)
+        assert denied.allowed is False
+        assert denied.remaining == 0
+        assert 0 < denied.reset_ms <= 60_000
+
+    @pytest.mark.asyncio
+    async def test_remaining_never_negative_after_handover(self):
+        """Test that handed-over hits past the limit report 0 remaining."""
+        backend = MemoryRateLimitBackend()
+        result = await backend.hit(b"key", 10, 60_000, admitted=[(0, 17)])
+        assert result.allowed is False
+        assert result.remaining == 0
+
+    @pytest.mark.asyncio
+    async def test_admitted_hits_keep_their_age(self):
+        """Test that handed-over hits leave the window when they would have."""
+        backend = MemoryRateLimitBackend()
+        result = await backend.hit(b"key", 10, 60_000, admitted=[(45_000, 2)])
+        assert result.remaining == 7
+        assert 14_000 < result.reset_ms <= 15_000
+
+
+@pytest.fixture
+def redis_server():
+    """Create an in-memory Redis server with Lua scripting."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeServer()
+
+
+def make_redis_backend(server) -> RedisRateLimitBackend:
+    """Build a Redis backend whose client talks to the fake server."""
+    import fakeredis
+
+    backend = RedisRateLimitBackend("redis://localhost:6379/1")
+    backend._client = fakeredis.FakeAsyncRedis(server=server)
+    return backend
+
+
+class TestRedisRateLimitBackend:
+    """Test the Redis sliding-window script and backend."""
+
+    @pytest.mark.asyncio
+    async def test_allows_requests_up_to_limit(self, redis_server):
+        """Test that hits are allowed until the limit is reached."""
+        backend = make_redis_backend(redis_server)
+        await backend.startup()
+        results = [await backend.hit(b"key", 3, 60_000) for _ in range(4)]
+        assert [result.allowed for result in results] == [True, True, True, False]
+        assert [result.remaining for result in results] == [2, 1, 0, 0]
+        assert 0 < results[-1].reset_ms <= 60_000
+
+    @pytest.mark.asyncio
+    async def test_loads_script_on_first_hit(self, redis_server):
+        """Test that a hit before startup() loads the script itself."""
+        backend = make_redis_backend(redis_server)
+        assert (await backend.hit(b"key", 1, 60_000)).allowed is True
+        assert backend._sha is not None
+
+    @pytest.mark.asyncio
+    async def test_reloads_script_after_flush(self, redis_server):
+        """Test that a flushed script cache is reloaded and the hit retried."""
+        backend = make_redis_backend(redis_server)
+        await backend.startup()
+        await backend._client.script_flush()
+        result = await backend.hit(b"key", 2, 60_000)
+        assert result.allowed is True
+        assert result.remaining == 1
+
+    @pytest.mark.asyncio
+    async def test_counts_admitted_hits(self, redis_server):
+        """Test that hits admitted by the pre-filter are added to the window."""
+        backend = make_redis_backend(redis_server)
+        result = await backend.hit(b"key", 10, 60_000, admitted=[(30_000, 2), (0, 3)])
+        assert result.allowed is True
+        assert result.remaining == 4
+        assert await backend._client.zcard(b"key") == 6
+        # The oldest handed-over hits leave the window first
+        assert 29_000 < result.reset_ms <= 30_000
+
+    @pytest.mark.asyncio
+    async def test_skips_admitted_hits_outside_window(self, redis_server):
+        """Test that handed-over hits already older than the window are not recorded."""
+        backend = make_redis_backend(redis_server)
+        result = await backend.hit(b"key", 10, 60_000, admitted=[(61_000, 4)])
+        assert result.remaining == 9
+
+    @pytest.mark.asyncio
+    async def test_remaining_never_negative_after_handover(self, redis_server):
+        """Test that admitted hits past the limit report 0 remaining."""
+        backend = make_redis_backend(redis_server)
+        result = await backend.hit(b"key", 10, 60_000, admitted=[(0, 17)])
+        assert result.allowed is False
+        assert result.remaining == 0
+
+    @pytest.mark.asyncio
+    async def test_workers_with_prefilter_share_one_budget(self, redis_server):
+        """Test that several pre-filtered workers never report negative remaining."""
+        limiters = []
+        for _ in range(3):
+            limiter = SlidingWindowRateLimiter("redis://localhost:6379/1", prefilter_ratio=0.8)
+            limiter.backend = make_redis_backend(redis_server)
+            limiters.append(limiter)
+
+        results = [await limiter.hit(b"k", 10, 60) for limiter in limiters for _ in range(9)]
+
+        assert all(result.remaining >= 0 for result in results)
+        assert [result.remaining for result in results if not result.allowed] == [0, 0]
+
+
+class TestSlidingWindowRateLimiter:
+    """Test limiter backend selection."""
+
+    def test_memory_storage_uses_memory_backend(self):
+        """Test that memory:// selects the in-process backend."""
+        limiter = SlidingWindowRateLimiter("memory://")
+        assert isinstance(limiter.backend, MemoryRateLimitBackend)
+
+    def test_unsupported_storage_raises(self):
+        """Test that unknown storage URIs are rejected."""
+        with pytest.raises(ValueError, match="Unsupported rate limit storage"):
+            SlidingWindowRateLimiter("memcached://localhost")
+
+
+class TestLocalPreFilter:
+    """Test in-process pre-filter in front of the shared backend."""
+
+    def test_admits_hits_below_ratio(self):
+        """Test that hits under ratio * limit are admitted locally."""
+        prefilter = LocalPreFilter(ratio=0.5)
+        results = [prefilter.hit(b"k", 10, 60) for _ in range(6)]
+        assert [result[:2] for result in results[:5]] == [(True, 1), (True, 2), (True, 3), (True, 4), (True, 5)]
+        assert results[5][0] is False
+        assert sum(count for _, count in results[5][2]) == 5
+
+    def test_unsent_hits_are_handed_over_once(self):
+        """Test that locally admitted hits are reported to the backend only once."""
+        prefilter = LocalPreFilter(ratio=0.2)
+        prefilter.hit(b"k", 10, 60)
+        prefilter.hit(b"k", 10, 60)
+        _, _, unsent = prefilter.hit(b"k", 10, 60)
+        assert [count for _, count in unsent] == [2]
+        assert 0 <= unsent[0][0] < 1000
+        assert prefilter.hit(b"k", 10, 60) == (False, 0, [])
+
+    def test_unsent_hits_carry_bucket_age(self):
+        """Test that handed-over hits are dated by the bucket they were counted in."""
+        prefilter = LocalPreFilter(ratio=0.2)
+        prefilter.hit(b"k", 10, 60)
+        # Age the first bucket by 20 seconds
+        prefilter._entries[b"k"].buckets[0][0] -= 20
+        prefilter.hit(b"k", 10, 60)
+        _, _, unsent = prefilter.hit(b"k", 10, 60)
+        assert [count for _, count in unsent] == [1, 1]
+        assert 20_000 <= unsent[0][0] < 21_000
+
+    def test_evicts_least_recently_used_keys(self):
+        """Test that the number of tracked keys is capped."""
+        prefilter = LocalPreFilter(ratio=0.8, max_keys=2)
+        for key in (b"a", b"b", b"c"):
+            prefilter.hit(key, 10, 60)
+        assert list(prefilter._entries) == [b"b", b"c"]
+
+    @pytest.mark.asyncio
+    async def test_limiter_hands_admitted_hits_to_backend(self):
+        """Test that the backend counts pre-filtered hits once it is consulted."""
+        limiter = SlidingWindowRateLimiter("redis://localhost:6379/1", prefilter_ratio=0.5)
+        limiter.backend = MemoryRateLimitBackend()
+        results = [await limiter.hit(b"k", 4, 60) for _ in range(5)]
+        assert [result.allowed for result in results] == [True, True, True, True, False]
+        assert results[3].remaining == 0
+
+    @pytest.mark.asyncio
+    async def test_local_admit_reports_oldest_bucket_reset(self):
+        """Test that a local admit's reset_ms is counted from the oldest bucket."""
+        limiter = SlidingWindowRateLimiter("redis://localhost:6379/1", prefilter_ratio=0.8)
+        limiter.backend = MemoryRateLimitBackend()
+
+        assert 59_000 < (await limiter.hit(b"k", 10, 60)).reset_ms <= 60_000
+        # Age the first bucket by 15 seconds
+        limiter.prefilter._entries[b"k"].buckets[0][0] -= 15
+        assert 44_000 < (await limiter.hit(b"k", 10, 60)).reset_ms <= 45_000
+
+    def test_prefilter_only_used_with_redis(self):
+        """Test that the in-process backend gets no pre-filter."""
+        assert SlidingWindowRateLimiter("memory://", prefilter_ratio=0.8).prefilter is None
+
+
+class TestRateLimitKeys:
+    """Test compact rate limit key encoding."""
+
+    def test_pack_address_packs_ip_addresses(self):
+        """Test that IPv4 and IPv6 addresses are packed to raw bytes."""
+        assert _pack_address("192.168.0.1") == bytes([192, 168, 0, 1])
+        assert len(_pack_address("2001:db8::1")) == 16
+
+    def test_pack_address_keeps_other_identifiers(self):
+        """Test that non-IP client identifiers are kept as text."""
+        assert _pack_address("unknown") == b"unknown"
+
+
+class TestRemoteAddress:
+    """Test client address resolution."""
+
+    def test_uses_leftmost_forwarded_address(self):
+        """Test that the original client is taken from X-Forwarded-For."""
+        request = make_request({"X-Forwarded-For": " 203.0.113.7 , 10.0.0.2, 10.0.0.3"})
+        assert get_remote_address_with_proxy(request) == "203.0.113.7"
+
+    def test_single_forwarded_address(self):
+        """Test a header with a single address."""
+        request = make_request({"X-Forwarded-For": "203.0.113.7"})
+        assert get_remote_address_with_proxy(request) == "203.0.113.7"
+
+    def test_falls_back_to_client_host(self):
+        """Test that the socket peer is used without a proxy header."""
+        assert get_remote_address_with_proxy(make_request()) == "10.0.0.1"
+        assert get_remote_address_with_proxy(make_request(client=None)) == "unknown"
+
+    def test_result_is_cached_on_request_state(self):
+        """Test that the address is stored on request.state."""
+        request = make_request({"X-Forwarded-For": "203.0.113.7"})
+        get_remote_address_with_proxy(request)
+        assert request.state.client_ip == "203.0.113.7"
@@ -1,53 +1,81 @@
 """Tests for business logic service."""
+import asyncio
+import threading
+from unittest.mock import MagicMock
 import pytest
-from datetime import datetime
+import orjson
+from app import services as services_module
 from app.services import CoffeeMachineService
 from app.models import MachineState, WaterContainer, CoffeeContainer, CoffeeType, RECIPES
 from app.exceptions import InsufficientResourcesException, ContainerOverflowException
-from app.storage import StorageInterface
+from app.storage import StorageInterface, JSONStorage
 
 
-class MockStorage(StorageInterface):
-    """Mock storage for testing."""
-    
-    def __init__(self):
-        self.state = MachineState(
-            water_container=WaterContainer(current_amount=1000.0, capacity=2000.0),
-            coffee_container=CoffeeContainer(current_amount=500.0, capacity=500.0),
-            total_coffees_made=0,
-            last_updated=datetime.now()
-        )
-        self.save_count = 0
-    
-    def load_state(self) -> MachineState:
-        return self.state
-    
-    def save_state(self, state: MachineState) -> None:
-        self.state = state
-        self.save_count += 1
+def make_mock_storage() -> MagicMock:
+    """Create a storage mock whose load_state returns a known-valid state."""
+    storage = MagicMock(spec=StorageInterface)
+    storage.load_state.return_value = MachineState.model_construct(
+        water_container=WaterContainer(current_amount=1000.0, capacity=2000.0),
+        coffee_container=CoffeeContainer(current_amount=500.0, capacity=500.0),
+        total_coffees_made=0
+    )
+    return storage
+
+
+@pytest.fixture(scope="module")
+def shared_service():
+    """Create one service with mock storage for the whole module."""
+    return CoffeeMachineService(make_mock_storage())
 
 
 class TestCoffeeMachineService:
     """Test CoffeeMachineService business logic."""
     
     @pytest.fixture
-    def service(self):
-        """Create service with mock storage."""
-        storage = MockStorage()
-        return CoffeeMachineService(storage)
+    def service(self, shared_service):
+        """Return the shared service restored to the initial mock state."""
+        state = shared_service.state
+        state.water_container.capacity = 2000.0
+        state.water_container.current_amount = 1000.0
+        state.coffee_container.capacity = 500.0
+        state.coffee_container.current_amount = 500.0
+        state.total_coffees_made = 0
+        
+        storage = shared_service.storage
+        storage.reset_mock(return_value=True, side_effect=True)
+        storage.load_state.return_value = state
+        
+        shared_service._dirty = False
+        shared_service._save_requested = asyncio.Event()
+        shared_service._save_seq = shared_service._saved_seq = 0
+        shared_service._broadcast_queue = asyncio.Queue(maxsize=services_module.BROADCAST_QUEUE_SIZE)
+        shared_service._update_low_levels()
+        shared_service._invalidate_status()
+        return shared_service
     
-    def test_make_espresso_success(self, service):
-        """Test successful espresso making."""
+    def test_uses_preloaded_state(self):
+        """Test that a state passed in is used without loading from storage."""
+        storage = make_mock_storage()
+        state = storage.load_state().model_copy(update={"total_coffees_made": 7})
+        
+        service = CoffeeMachineService(storage, state)
+        
+        assert service.state is state
+    
+    @pytest.mark.parametrize("coffee_type", list(CoffeeType))
+    def test_make_coffee_success(self, service, coffee_type):
+        """Test that each coffee type uses its recipe and is counted."""
         initial_water = service.state.water_container.current_amount
         initial_coffee = service.state.coffee_container.current_amount
         initial_count = service.state.total_coffees_made
+        coffee_needed, water_needed = RECIPES[coffee_type]
         
-        result = service.make_coffee(CoffeeType.ESPRESSO)
+        result = service.make_coffee(coffee_type)
         
         assert result["success"] is True
-        assert "espresso" in result["message"].lower()
-        assert service.state.water_container.current_amount == initial_water - RECIPES[CoffeeType.ESPRESSO]["water"]
-        assert service.state.coffee_container.current_amount == initial_coffee - RECIPES[CoffeeType.ESPRESSO]["coffee"]
+        assert result["message"] == services_module.COFFEE_READY_MESSAGES[coffee_type]
+        assert service.state.water_container.current_amount == initial_water - water_needed
+        assert service.state.coffee_container.current_amount == initial_coffee - coffee_needed
         assert service.state.total_coffees_made == initial_count + 1
     
     def test_make_espresso_insufficient_water(self, service):
@@ -58,41 +86,27 @@ class TestCoffeeMachineService:
             service.make_coffee(CoffeeType.ESPRESSO)
         
         assert exc_info.value.resource_type == "water"
-        assert exc_info.value.needed == RECIPES[CoffeeType.ESPRESSO]["water"]
+        assert exc_info.value.needed == RECIPES[CoffeeType.ESPRESSO][1]
         assert exc_info.value.available == 10.0
     
     def test_make_espresso_insufficient_coffee(self, service):
         """Test espresso making with insufficient coffee."""
         service.state.coffee_container.current_amount = 5.0
         
-        with pytest.raises(InsufficientResourcesException) as exc_info:
+        with pytest.raises(InsufficientResourcesException, match=r"Not enough coffee\. Need 8\.0g but only 5\.0g"):
             service.make_coffee(CoffeeType.ESPRESSO)
-        
-        assert exc_info.value.resource_type == "coffee"
-        assert exc_info.value.needed == RECIPES[CoffeeType.ESPRESSO]["coffee"]
-        assert exc_info.value.available == 5.0
-    
-    def test_make_double_espresso_success(self, service):
-        """Test successful double espresso making."""
-        initial_water = service.state.water_container.current_amount
-        initial_coffee = service.state.coffee_container.current_amount
-        
-        result = service.make_coffee(CoffeeType.DOUBLE_ESPRESSO)
-        
-        assert result["success"] is True
-        assert service.state.water_container.current_amount == initial_water - RECIPES[CoffeeType.DOUBLE_ESPRESSO]["water"]
-        assert service.state.coffee_container.current_amount == initial_coffee - RECIPES[CoffeeType.DOUBLE_ESPRESSO]["coffee"]
     
-    def test_make_americano_success(self, service):
-        """Test successful americano making."""
-        initial_water = service.state.water_container.current_amount
-        initial_coffee = service.state.coffee_container.current_amount
+    def test_low_level_warning_only_below_threshold(self, service, monkeypatch):
+        """Test that a low water warning is logged once the level drops below 20%."""
+        warnings = []
+        monkeypatch.setattr(services_module.logger, "warning", lambda event, **kw: warnings.append((event, kw)))
+        service.state.water_container.current_amount = 430.0
         
-        result = service.make_coffee(CoffeeType.AMERICANO)
+        service.make_coffee(CoffeeType.ESPRESSO)  # 406ml left, 20.3%
+        assert warnings == []
         
-        assert result["success"] is True
-        assert service.state.water_container.current_amount == initial_water - RECIPES[CoffeeType.AMERICANO]["water"]
-        assert service.state.coffee_container.current_amount == initial_coffee - RECIPES[CoffeeType.AMERICANO]["coffee"]
+        service.make_coffee(CoffeeType.ESPRESSO)  # 382ml left, 19.1%
+        assert warnings == [("Water level low", {"percentage": 19.1})]
     
     def test_get_status(self, service):
         """Test getting machine status."""
@@ -104,13 +118,71 @@ class TestCoffeeMachineService:
         assert "coffee_level" in status["data"]
         assert "total_coffees_made" in status["data"]
     
+    def test_get_status_reflects_mutations_immediately(self, service):
+        """Test that the cached status is invalidated by service operations."""
+        before = service.get_status()["data"]["water_level"]
+        
+        service.fill_water(500.0)
+        
+        assert service.get_status()["data"]["water_level"] == before + 500.0
+    
+    def test_get_status_sends_unrounded_percentages(self, service):
+        """Test that percentages are not rounded and last_updated is ISO formatted."""
+        service.fill_water(0.123)
+        data = service.get_status()["data"]
+        
+        assert data["water_percentage"] == pytest.approx(50.00615)
+        assert data["last_updated"] == service.state.last_updated.isoformat()
+    
+    def test_get_status_json_matches_status_and_tracks_changes(self, service):
+        """Test that serialized status is reused until state changes."""
+        body, etag = service.get_status_json()
+        
+        assert orjson.loads(body) == service.get_status()
+        assert service.get_status_json()[1] == etag
+        
+        service.fill_water(500.0)
+        
+        assert service.get_status_json()[1] != etag
+    
+    def test_get_status_json_outlives_status_ttl(self, service, monkeypatch):
+        """Test that the serialized status is reused after the snapshot TTL while state is unchanged."""
+        first = service.get_status_json()
+        monkeypatch.setattr(services_module, "STATUS_CACHE_TTL", 0.0)
+        
+        assert service.get_status_json() is first
+    
+    def test_operations_queue_broadcasts(self, service):
+        """Test that operations queue broadcasts instead of creating tasks."""
+        service.make_coffee(CoffeeType.ESPRESSO)
+        service.fill_water(100.0)
+        
+        kinds = [service._broadcast_queue.get_nowait()[0] for _ in range(3)]
+        assert kinds == ["coffee_made", "status", "status"]
+    
+    def test_broadcasts_dropped_when_queue_full(self, service, monkeypatch):
+        """Test that a full broadcast queue drops events instead of failing."""
+        monkeypatch.setattr(service, "_broadcast_queue", asyncio.Queue(maxsize=1))
+        
+        service.fill_water(100.0)
+        service.fill_water(100.0)
+        
+        assert service._broadcast_queue.qsize() == 1
+        assert service.state.water_container.current_amount == 1200.0
+    
     def test_fill_water_success(self, service):
         """Test successful water fill."""
         initial_amount = service.state.water_container.current_amount
         
         result = service.fill_water(500.0)
         
-        assert result["success"] is True
+        assert result == {
+            "success": True,
+            "container": "water",
+            "added": 500.0,
+            "current": initial_amount + 500.0,
+            "capacity": 2000.0,
+        }
         assert service.state.water_container.current_amount == initial_amount + 500.0
     
     def test_fill_water_overflow(self, service):
@@ -132,17 +204,17 @@ class TestCoffeeMachineService:
         result = service.fill_coffee(100.0)
         
         assert result["success"] is True
+        assert result["container"] == "coffee"
+        assert result["current"] == 400.0
         assert service.state.coffee_container.current_amount == initial_amount + 100.0
     
     def test_fill_coffee_overflow(self, service):
         """Test coffee fill overflow."""
         service.state.coffee_container.current_amount = 450.0
         
-        with pytest.raises(ContainerOverflowException) as exc_info:
-            service.fill_coffee(100.0)  # Would exceed 500g capacity
-        
-        assert exc_info.value.container_type == "coffee"
-        assert exc_info.value.capacity == 500.0
+        # Would exceed 500g capacity
+        with pytest.raises(ContainerOverflowException, match=r"coffee container\. Capacity is 500\.0g"):
+            service.fill_coffee(100.0)
     
     def test_reset(self, service):
         """Test resetting machine state."""
@@ -158,15 +230,157 @@ class TestCoffeeMachineService:
         assert service.state.coffee_container.current_amount == 0.0
         assert service.state.total_coffees_made == 0
     
-    def test_state_is_saved_after_operations(self, service):
-        """Test that state is saved after each operation."""
-        storage = MockStorage()
-        service_with_storage = CoffeeMachineService(storage)
+    def test_make_coffee_saves_state(self, service):
+        """Test that making coffee is saved on the next flush."""
+        save_state = service.storage.save_state
+        
+        service.make_coffee(CoffeeType.ESPRESSO)
+        save_state.assert_not_called()
+        
+        service.flush()
+        save_state.assert_called_once_with(service.state)
+    
+    def test_fill_water_saves_state(self, service):
+        """Test that filling water is saved on the next flush."""
+        save_state = service.storage.save_state
+        
+        service.fill_water(100.0)
+        save_state.assert_not_called()
+        
+        service.flush()
+        save_state.assert_called_once_with(service.state)
+    
+    def test_operations_are_coalesced_into_one_save(self, service):
+        """Test that several operations between flushes cause a single save."""
+        save_state = service.storage.save_state
+        
+        service.make_coffee(CoffeeType.ESPRESSO)
+        service.fill_water(100.0)
+        service.flush()
+        
+        # Nothing changed since the last save
+        service.flush()
+        assert save_state.call_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_reset_wakes_save_worker(self, service):
+        """Test that reset is saved by the worker without waiting for its interval."""
+        save_state = service.storage.save_state
+        worker = asyncio.create_task(service.run_save_worker(60.0))
+        try:
+            service.fill_water(100.0)
+            service.reset()
+            # reset does not write on the event loop itself
+            save_state.assert_not_called()
+            for _ in range(100):
+                if save_state.called:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            worker.cancel()
+        
+        save_state.assert_called_once()
+        assert save_state.call_args.args[0].total_coffees_made == 0
+        assert save_state.call_args.args[0].water_container.current_amount == 0.0
+        assert service._dirty is False
+    
+    def test_older_snapshot_never_replaces_newer(self, service):
+        """Test that a write with an earlier sequence number is skipped."""
+        save_state = service.storage.save_state
+        stale_seq, fresh_seq = service._next_save_seq(), service._next_save_seq()
         
-        initial_save_count = storage.save_count
-        service_with_storage.make_coffee(CoffeeType.ESPRESSO)
-        assert storage.save_count == initial_save_count + 1
+        service._save(service.state, fresh_seq)
+        service._save(service.state, stale_seq)
         
-        service_with_storage.fill_water(100.0)
-        assert storage.save_count == initial_save_count + 2
+        save_state.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_save_worker_flushes_changes(self, service):
+        """Test that the save worker persists changes in the background."""
+        save_state = service.storage.save_state
+        worker = asyncio.create_task(service.run_save_worker(0.01))
+        try:
+            service.fill_water(100.0)
+            await asyncio.sleep(0.05)
+        finally:
+            worker.cancel()
+        
+        save_state.assert_called_once()
+        # The worker writes a copy, so later changes cannot leak into a write in progress
+        saved = save_state.call_args.args[0]
+        assert saved is not service.state
+        assert saved.water_container.current_amount == 1100.0
+    
+    @pytest.mark.asyncio
+    async def test_save_worker_retries_after_failure(self, service):
+        """Test that a failed background save leaves the state dirty for the next attempt."""
+        service.storage.save_state.side_effect = IOError("disk full")
+        worker = asyncio.create_task(service.run_save_worker(0.01))
+        try:
+            service.fill_water(100.0)
+            await asyncio.sleep(0.05)
+        finally:
+            worker.cancel()
+        
+        assert service._dirty is True
+    
+    @pytest.mark.asyncio
+    async def test_save_worker_cancelled_during_failed_write_stays_dirty(self, service):
+        """Test that a write failing after shutdown began leaves the state for flush() to save."""
+        started, release = threading.Event(), threading.Event()
+        
+        def fail(state):
+            started.set()
+            release.wait(1)
+            raise IOError("disk full")
+        
+        service.storage.save_state.side_effect = fail
+        worker = asyncio.create_task(service.run_save_worker(0.0))
+        service.fill_water(100.0)
+        await asyncio.to_thread(started.wait, 1)
+        
+        worker.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await worker
+        
+        assert service._dirty is True
+
 
+class TestSaveOrdering:
+    """Test that saves reach the state file in order."""
+    
+    @pytest.mark.asyncio
+    async def test_reset_during_in_flight_write_is_not_lost(self, tmp_path):
+        """Test that a stale snapshot written after reset cannot replace the reset state."""
+        storage = JSONStorage(str(tmp_path / "state.json"))
+        service = CoffeeMachineService(storage, MachineState(
+            water_container=WaterContainer(current_amount=1000.0),
+            coffee_container=CoffeeContainer(current_amount=500.0)
+        ))
+        started, release = threading.Event(), threading.Event()
+        save_state = storage.save_state
+        
+        def slow_save(state):
+            # Only the first (pre-reset) write is held up
+            if not started.is_set():
+                started.set()
+                release.wait(1)
+            save_state(state)
+        
+        storage.save_state = slow_save
+        worker = asyncio.create_task(service.run_save_worker(0.0))
+        service.make_coffee(CoffeeType.ESPRESSO)
+        await asyncio.to_thread(started.wait, 1)
+        
+        # Reset while the pre-reset snapshot is still being written
+        service.reset()
+        worker.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await worker
+        service.flush()
+        
+        saved = JSONStorage(storage.file_path).load_state()
+        assert saved.total_coffees_made == 0
+        assert saved.water_container.current_amount == 0.0
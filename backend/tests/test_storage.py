@@ -1,101 +1,245 @@
 """Tests for storage layer."""
 import pytest
 import json
-import tempfile
 import os
 from datetime import datetime
 from app.storage import StorageInterface, JSONStorage, get_storage
 from app.models import MachineState, WaterContainer, CoffeeContainer
 
+# Fixed timestamp (with microseconds) so tests are deterministic
+FIXED_NOW = datetime(2024, 1, 1, 12, 0, 0, 123456)
+
+
+@pytest.fixture(scope="module")
+def storage_dir(tmp_path_factory):
+    """Create one temp directory for the module; each test uses its own file in it."""
+    return tmp_path_factory.mktemp("jsonstore")
+
 
 class TestJSONStorage:
     """Test JSONStorage implementation."""
 
-    def test_save_and_load_state(self):
+    def test_save_and_load_state(self, storage_dir):
         """Test saving and loading state from JSON file."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            file_path = f.name
-        
-        try:
-            storage = JSONStorage(file_path)
-            
-            # Create initial state
-            initial_state = MachineState(
-                water_container=WaterContainer(current_amount=100.0, capacity=2000.0),
-                coffee_container=CoffeeContainer(current_amount=50.0, capacity=500.0),
-                total_coffees_made=5,
-                last_updated=datetime.now()
-            )
-            
-            # Save state
-            storage.save_state(initial_state)
-            
-            # Load state
-            loaded_state = storage.load_state()
-            
-            assert loaded_state.water_container.current_amount == 100.0
-            assert loaded_state.coffee_container.current_amount == 50.0
-            assert loaded_state.total_coffees_made == 5
-        finally:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
-
-    def test_load_state_creates_new_if_file_doesnt_exist(self):
+        storage = JSONStorage(str(storage_dir / "save_and_load.json"))
+        
+        # Create initial state
+        initial_state = MachineState(
+            water_container=WaterContainer(current_amount=100.0, capacity=2000.0),
+            coffee_container=CoffeeContainer(current_amount=50.0, capacity=500.0),
+            total_coffees_made=5,
+            last_updated=FIXED_NOW
+        )
+        
+        # Save state
+        storage.save_state(initial_state)
+        
+        # Load state
+        loaded_state = storage.load_state()
+        
+        assert loaded_state.water_container.current_amount == 100.0
+        assert loaded_state.coffee_container.current_amount == 50.0
+        assert loaded_state.total_coffees_made == 5
+
+    def test_saved_file_is_compact_json_with_iso_timestamp(self, storage_dir):
+        """Test that the saved file is compact JSON and keeps last_updated exactly."""
+        file_path = storage_dir / "compact.json"
+        storage = JSONStorage(str(file_path))
+        now = FIXED_NOW
+        storage.save_state(MachineState(
+            water_container=WaterContainer(),
+            coffee_container=CoffeeContainer(),
+            last_updated=now
+        ))
+        
+        text = file_path.read_text(encoding='utf-8')
+        assert text.startswith('{"water_container":{"capacity"')
+        assert "percent_per_unit" not in text
+        assert json.loads(text)["last_updated"] == now.isoformat()
+        assert storage.load_state().last_updated == now
+
+    def test_pretty_storage_indents_saved_file(self, storage_dir):
+        """Test that pretty=True writes indented JSON."""
+        file_path = storage_dir / "pretty.json"
+        storage = JSONStorage(str(file_path), pretty=True)
+        storage.save_state(MachineState(
+            water_container=WaterContainer(),
+            coffee_container=CoffeeContainer()
+        ))
+        
+        assert file_path.read_text(encoding='utf-8').startswith('{\n  "water_container"')
+
+    def test_identical_save_skips_write(self, storage_dir, monkeypatch):
+        """Test that saving unchanged contents does not touch the file again."""
+        file_path = str(storage_dir / "identical.json")
+        storage = JSONStorage(file_path)
+        state = MachineState(
+            water_container=WaterContainer(current_amount=100.0),
+            coffee_container=CoffeeContainer(),
+            last_updated=FIXED_NOW
+        )
+        storage.save_state(state)
+        
+        replaced = []
+        monkeypatch.setattr(os, "replace", lambda *args: replaced.append(args))
+        storage.save_state(state)
+        assert replaced == []
+        
+        # A fresh storage that loaded the file also skips the identical save
+        reloaded = JSONStorage(file_path)
+        reloaded.save_state(reloaded.load_state())
+        assert replaced == []
+        
+        state.water_container.current_amount = 50.0
+        storage.save_state(state)
+        assert len(replaced) == 1
+
+    def test_load_keeps_digest_of_save_made_during_load(self, storage_dir, monkeypatch):
+        """Test that a load does not record a stale digest over a concurrent save."""
+        file_path = str(storage_dir / "concurrent.json")
+        storage = JSONStorage(file_path)
+        storage.save_state(MachineState(
+            water_container=WaterContainer(current_amount=100.0),
+            coffee_container=CoffeeContainer(),
+            last_updated=FIXED_NOW
+        ))
+        newer = MachineState(
+            water_container=WaterContainer(current_amount=50.0),
+            coffee_container=CoffeeContainer(),
+            last_updated=FIXED_NOW
+        )
+        validate = MachineState.model_validate_json
+        
+        def validate_while_saving(content):
+            # Another thread saves while this load is parsing the old contents
+            storage.save_state(newer)
+            return validate(content)
+        
+        monkeypatch.setattr(MachineState, "model_validate_json", validate_while_saving)
+        storage.load_state()
+        
+        replaced = []
+        monkeypatch.setattr(os, "replace", lambda *args: replaced.append(args))
+        storage.save_state(newer)
+        assert replaced == []
+
+    def test_load_state_creates_new_if_file_doesnt_exist(self, storage_dir):
         """Test that loading from non-existent file returns new state."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            file_path = f.name
-        
-        try:
-            os.unlink(file_path)  # Ensure file doesn't exist
-            
-            storage = JSONStorage(file_path)
-            state = storage.load_state()
-            
-            assert state.water_container.current_amount == 0.0
-            assert state.coffee_container.current_amount == 0.0
-            assert state.total_coffees_made == 0
-        finally:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
-
-    def test_load_state_handles_invalid_json(self):
+        storage = JSONStorage(str(storage_dir / "missing.json"))
+        state = storage.load_state()
+        
+        assert state.water_container.current_amount == 0.0
+        assert state.coffee_container.current_amount == 0.0
+        assert state.total_coffees_made == 0
+
+    def test_load_state_handles_invalid_json(self, storage_dir):
         """Test that loading invalid JSON returns new state."""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-            f.write("invalid json content")
-            file_path = f.name
-        
-        try:
-            storage = JSONStorage(file_path)
-            state = storage.load_state()
-            
-            # Should return new state on error
-            assert state.water_container.current_amount == 0.0
-            assert state.coffee_container.current_amount == 0.0
-        finally:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
-
-    def test_save_state_creates_parent_directory(self):
+        file_path = storage_dir / "invalid.json"
+        file_path.write_text("invalid json content")
+        
+        storage = JSONStorage(str(file_path))
+        state = storage.load_state()
+        
+        # Should return new state on error
+        assert state.water_container.current_amount == 0.0
+        assert state.coffee_container.current_amount == 0.0
+
+    def test_load_state_rejects_out_of_bounds_contents(self, storage_dir):
+        """Test that a file whose amounts break container bounds loads as new state."""
+        file_path = storage_dir / "out_of_bounds.json"
+        file_path.write_text(
+            '{"water_container": {"capacity": 2000.0, "current_amount": -5.0},'
+            ' "coffee_container": {"capacity": 500.0, "current_amount": 0.0},'
+            ' "total_coffees_made": 1, "last_updated": "2024-01-01T12:00:00"}'
+        )
+        
+        state = JSONStorage(str(file_path)).load_state()
+        
+        assert state.water_container.current_amount == 0.0
+        assert state.total_coffees_made == 0
+
+    def test_save_state_creates_parent_directory(self, storage_dir):
         """Test that save_state creates parent directories if needed."""
-        temp_dir = tempfile.mkdtemp()
-        file_path = os.path.join(temp_dir, "subdir", "machine_state.json")
+        file_path = storage_dir / "subdir" / "machine_state.json"
+        storage = JSONStorage(str(file_path))
+        state = MachineState.model_construct(
+            water_container=WaterContainer(),
+            coffee_container=CoffeeContainer(),
+            total_coffees_made=0
+        )
+        
+        storage.save_state(state)
+        
+        assert file_path.exists()
+
+    def test_non_durable_save_writes_in_place(self, storage_dir, monkeypatch):
+        """Test that durable=False overwrites the file without a temp file and rename."""
+        file_path = str(storage_dir / "non_durable.json")
+        storage = JSONStorage(file_path, durable=False)
+        monkeypatch.setattr(os, "replace", lambda *args: pytest.fail("os.replace called"))
+        storage.save_state(MachineState(
+            water_container=WaterContainer(current_amount=100.0),
+            coffee_container=CoffeeContainer(),
+            total_coffees_made=3
+        ))
+        
+        assert not os.path.exists(f"{file_path}.tmp")
+        assert storage.load_state().total_coffees_made == 3
+
+    def test_durable_save_fsyncs_file_and_directory(self, storage_dir, monkeypatch):
+        """Test that a durable save flushes the temp file and its directory to disk."""
+        synced = []
+        real_fsync = os.fsync
+        
+        def record_fsync(fd):
+            synced.append(fd)
+            real_fsync(fd)
+        
+        monkeypatch.setattr(os, "fsync", record_fsync)
+        storage = JSONStorage(str(storage_dir / "fsynced.json"))
+        storage.save_state(MachineState(
+            water_container=WaterContainer(),
+            coffee_container=CoffeeContainer()
+        ))
+        
+        assert len(synced) == 2
         
-        try:
-            storage = JSONStorage(file_path)
-            state = MachineState(
+        synced.clear()
+        JSONStorage(str(storage_dir / "not_fsynced.json"), durable=False).save_state(
+            storage.load_state()
+        )
+        assert synced == []
+
+    def test_failed_save_removes_temp_file(self, storage_dir, monkeypatch):
+        """Test that a failed durable save raises IOError and leaves no temp file."""
+        file_path = storage_dir / "failed.json"
+        storage = JSONStorage(str(file_path))
+        
+        def fail_replace(src, dst):
+            raise OSError("disk full")
+        
+        monkeypatch.setattr(os, "replace", fail_replace)
+        
+        with pytest.raises(IOError, match="Failed to save state"):
+            storage.save_state(MachineState(
                 water_container=WaterContainer(),
-                coffee_container=CoffeeContainer(),
-                total_coffees_made=0,
-                last_updated=datetime.now()
-            )
-            
-            storage.save_state(state)
-            
-            assert os.path.exists(file_path)
-        finally:
-            import shutil
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
+                coffee_container=CoffeeContainer()
+            ))
+        
+        assert not (storage_dir / "failed.json.tmp").exists()
+        assert not file_path.exists()
+
+    def test_save_state_to_bare_file_name(self, storage_dir, monkeypatch):
+        """Test that a path without a directory part saves to the working directory."""
+        monkeypatch.chdir(storage_dir)
+        
+        storage = JSONStorage("machine_state.json")
+        storage.save_state(MachineState(
+            water_container=WaterContainer(),
+            coffee_container=CoffeeContainer()
+        ))
+        
+        assert (storage_dir / "machine_state.json").exists()
 
 
 class TestStorageFactory:
@@ -105,9 +249,20 @@ class TestStorageFactory:
         """Test that get_storage returns JSONStorage for json type."""
         storage = get_storage("json", file_path="test.json")
         assert isinstance(storage, JSONStorage)
+        assert storage.durable is True
+
+    def test_get_storage_reuses_instance_for_same_arguments(self):
+        """Test that the factory returns one shared storage per file."""
+        storage = get_storage("json", file_path="test.json")
+        assert get_storage("json", file_path="test.json") is storage
+        assert get_storage("json", file_path="other.json") is not storage
+
+    def test_get_storage_passes_durability_through(self):
+        """Test that get_storage honors an explicit durable flag."""
+        storage = get_storage("json", file_path="test.json", durable=False)
+        assert storage.durable is False
 
     def test_get_storage_raises_for_unsupported_type(self):
         """Test that get_storage raises error for unsupported types."""
         with pytest.raises(ValueError, match="Unsupported storage type"):
             get_storage("redis", file_path="test.json")
-
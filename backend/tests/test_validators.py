@@ -0,0 +1,58 @@
+"""Tests for validation helpers."""
+import pytest
+from app.validators import ValidationHelpers
+
+
+class TestSanitizeString:
+    """Test ValidationHelpers.sanitize_string."""
+
+    def test_printable_ascii_is_only_stripped(self):
+        """Test that plain text passes through apart from surrounding whitespace."""
+        assert ValidationHelpers.sanitize_string("  Hello, world!  ") == "Hello, world!"
+
+    def test_control_characters_are_removed(self):
+        """Test that control characters are dropped but newlines and tabs kept."""
+        assert ValidationHelpers.sanitize_string("a\x00b\x1fc\x7fd\x9fe") == "abcde"
+        assert ValidationHelpers.sanitize_string("line1\n\tline2") == "line1\n\tline2"
+
+    def test_non_ascii_text_is_kept(self):
+        """Test that printable non-ASCII characters are not treated as control characters."""
+        assert ValidationHelpers.sanitize_string("café\x07") == "café"
+
+    def test_too_long_string_raises(self):
+        """Test that strings over max_length are rejected."""
+        with pytest.raises(ValueError, match="String too long"):
+            ValidationHelpers.sanitize_string("abc", max_length=2)
+
+
+class TestValidateCoffeeType:
+    """Test ValidationHelpers.validate_coffee_type."""
+
+    def test_valid_type_is_lowercased(self):
+        """Test that a known type is accepted case-insensitively."""
+        assert ValidationHelpers.validate_coffee_type("Espresso") == "espresso"
+
+    def test_invalid_type_lists_valid_types(self):
+        """Test that the error names every valid type."""
+        with pytest.raises(ValueError, match="Valid types: americano, double_espresso, espresso, ristretto"):
+            ValidationHelpers.validate_coffee_type("latte")
+
+
+class TestValidateContainerAmount:
+    """Test ValidationHelpers.validate_container_amount."""
+
+    def test_fill_within_capacity_passes(self):
+        """Test that a fill up to capacity is accepted."""
+        ValidationHelpers.validate_container_amount(100.0, 1900.0, 2000.0, "water")
+
+    def test_non_positive_amount_raises(self):
+        """Test that zero or negative amounts are rejected."""
+        with pytest.raises(ValueError, match="must be positive"):
+            ValidationHelpers.validate_container_amount(100.0, 0.0, 2000.0, "water")
+
+    def test_overflow_raises(self):
+        """Test that exceeding capacity, including by more than the whole capacity, is rejected."""
+        with pytest.raises(ValueError, match="Available space: 100.0"):
+            ValidationHelpers.validate_container_amount(1900.0, 200.0, 2000.0, "water")
+        with pytest.raises(ValueError, match="would overflow water"):
+            ValidationHelpers.validate_container_amount(0.0, 3000.0, 2000.0, "water")
@@ -0,0 +1,165 @@
+"""Tests for WebSocket connection manager."""
+import orjson
+import pytest
+from app import websocket_manager
+from app.websocket_manager import ConnectionManager
+
+
+class MockWebSocket:
+    """WebSocket stand-in that records sent frames."""
+
+    def __init__(self, fail: bool = False):
+        """Initialize mock, optionally failing every send."""
+        self.fail = fail
+        self.sent = []
+
+    async def accept(self):
+        """Accept the connection."""
+
+    async def send_bytes(self, data: bytes):
+        """Record a frame or simulate a dropped client."""
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self.sent.append(data)
+
+
+class TestConnectionManager:
+    """Test ConnectionManager broadcasting."""
+
+    @pytest.mark.asyncio
+    async def test_broadcast_bytes_sends_same_frame_to_all(self):
+        """Test that every client receives the pre-encoded frame."""
+        manager = ConnectionManager()
+        clients = [MockWebSocket(), MockWebSocket()]
+        for ws in clients:
+            await manager.connect(ws)
+
+        await manager.broadcast_bytes(b"frame")
+
+        assert [ws.sent for ws in clients] == [[b"frame"], [b"frame"]]
+
+    @pytest.mark.asyncio
+    async def test_broadcast_bytes_disconnects_failed_clients(self):
+        """Test that a failing client is dropped without affecting others."""
+        manager = ConnectionManager()
+        healthy, broken = MockWebSocket(), MockWebSocket(fail=True)
+        await manager.connect(healthy)
+        await manager.connect(broken)
+
+        await manager.broadcast_bytes(b"frame")
+
+        assert healthy.sent == [b"frame"]
+        assert list(manager.connection_metadata) == [healthy]
+
+    @pytest.mark.asyncio
+    async def test_broadcast_excludes_sender(self):
+        """Test that the excluded connection receives nothing."""
+        manager = ConnectionManager()
+        sender, other = MockWebSocket(), MockWebSocket()
+        await manager.connect(sender)
+        await manager.connect(other)
+
+        await manager.broadcast({"type": "status_update"}, exclude=sender)
+        await manager._flush_task
+
+        assert sender.sent == []
+        assert len(other.sent) == 1
+
+    @pytest.mark.asyncio
+    async def test_excluded_broadcast_keeps_order_with_pending(self):
+        """Test that an excluding broadcast is sent after the messages queued before it."""
+        manager = ConnectionManager()
+        sender, other = MockWebSocket(), MockWebSocket()
+        await manager.connect(sender)
+        await manager.connect(other)
+
+        await manager.broadcast({"type": "status_update", "n": 1})
+        await manager.broadcast({"type": "status_update", "n": 2}, exclude=sender)
+        await manager._flush_task
+
+        assert [orjson.loads(frame) for frame in other.sent] == [
+            {"type": "batch", "messages": [{"type": "status_update", "n": 1}, {"type": "status_update", "n": 2}]}
+        ]
+        assert [orjson.loads(frame) for frame in sender.sent] == [{"type": "status_update", "n": 1}]
+
+    @pytest.mark.asyncio
+    async def test_close_cancels_pending_flush(self):
+        """Test that close() stops a flush that has not run yet."""
+        manager = ConnectionManager()
+        client = MockWebSocket()
+        await manager.connect(client)
+
+        await manager.broadcast({"type": "status_update"})
+        await manager.close()
+
+        assert manager._flush_task.cancelled()
+        assert client.sent == []
+
+    @pytest.mark.asyncio
+    async def test_broadcast_without_clients_skips_encoding(self, monkeypatch):
+        """Test that nothing is encoded when no client is connected."""
+        manager = ConnectionManager()
+        monkeypatch.setattr(websocket_manager.orjson, "dumps", pytest.fail)
+
+        await manager.broadcast({"type": "status_update"})
+
+    @pytest.mark.asyncio
+    async def test_back_to_back_broadcasts_share_timestamp(self, monkeypatch):
+        """Test that messages produced in the same burst reuse one timestamp string."""
+        # Widen the window so a slow test run still counts as one burst
+        monkeypatch.setattr(websocket_manager, "TIMESTAMP_REUSE_WINDOW", 60.0)
+        monkeypatch.setattr(websocket_manager, "_ts_cache", None)
+        manager = ConnectionManager()
+        client = MockWebSocket()
+        await manager.connect(client)
+
+        await manager.broadcast_coffee_made("espresso", {"coffee": 8.0, "water": 24.0})
+        await manager.broadcast_status_update({})
+        await manager._flush_task
+
+        first, second = orjson.loads(client.sent[0])["messages"]
+        assert first["timestamp"] == second["timestamp"]
+
+    @pytest.mark.asyncio
+    async def test_disconnect_is_idempotent(self):
+        """Test that disconnecting twice or an unknown socket is a no-op."""
+        manager = ConnectionManager()
+        client = MockWebSocket()
+        await manager.connect(client)
+
+        manager.disconnect(client)
+        manager.disconnect(client)
+        manager.disconnect(MockWebSocket())
+
+        assert manager.get_stats() == {"total_connections": 0, "connections": []}
+
+    @pytest.mark.asyncio
+    async def test_broadcasts_in_one_tick_are_batched(self):
+        """Test that broadcasts made back-to-back reach each client as one frame."""
+        manager = ConnectionManager()
+        client = MockWebSocket()
+        await manager.connect(client)
+
+        await manager.broadcast({"type": "coffee_made"})
+        await manager.broadcast({"type": "status_update"})
+        await manager._flush_task
+
+        assert [orjson.loads(frame) for frame in client.sent] == [
+            {"type": "batch", "messages": [{"type": "coffee_made"}, {"type": "status_update"}]}
+        ]
+
+    @pytest.mark.asyncio
+    async def test_single_broadcast_is_sent_unwrapped(self):
+        """Test that a lone broadcast is not wrapped in a batch envelope."""
+        manager = ConnectionManager()
+        client = MockWebSocket()
+        await manager.connect(client)
+
+        await manager.broadcast({"type": "status_update"})
+        await manager._flush_task
+        await manager.broadcast({"type": "error"})
+        await manager._flush_task
+
+        assert [orjson.loads(frame) for frame in client.sent] == [
+            {"type": "status_update"}, {"type": "error"}
+        ]
@@ -1,6 +1,12 @@
 /**
  * WebSocket service for real-time updates from the coffee machine API.
+ *
+ * The server sends JSON messages as binary frames; the heartbeat is a single
+ * 0x01 byte. Messages broadcast together arrive as one
+ * {"type": "batch", "messages": [...]} frame and are emitted one by one.
  */
+const PING_FRAME = new Uint8Array([0x01]);
+
 class WebSocketService {
   constructor() {
     this.ws = null;
@@ -10,6 +16,7 @@ class WebSocketService {
     this.listeners = new Map();
     this.isConnecting = false;
     this.heartbeatInterval = null;
+    this.decoder = new TextDecoder();
   }
 
   connect(url = null) {
@@ -42,6 +49,7 @@ class WebSocketService {
 
     try {
       this.ws = new WebSocket(wsUrl);
+      this.ws.binaryType = 'arraybuffer';
 
       this.ws.onopen = () => {
         console.log('WebSocket connected');
@@ -55,12 +63,17 @@ class WebSocketService {
 
       this.ws.onmessage = (event) => {
         try {
-          const message = JSON.parse(event.data);
-          console.log('WebSocket message:', message);
+          const raw = typeof event.data === 'string' ? event.data : this.decoder.decode(event.data);
+          const frame = JSON.parse(raw);
+          const messages = frame.type === 'batch' ? frame.messages : [frame];
           
-          // Emit message to listeners based on type
-          this.emit(message.type, message);
-          this.emit('message', message);
+          for (const message of messages) {
+            console.log('WebSocket message:', message);
+            
+            // Emit message to listeners based on type
+            this.emit(message.type, message);
+            this.emit('message', message);
+          }
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
         }
@@ -105,7 +118,7 @@ class WebSocketService {
 
   send(message) {
     if (this.ws?.readyState === WebSocket.OPEN) {
-      if (typeof message === 'string') {
+      if (typeof message === 'string' || message instanceof Uint8Array) {
         this.ws.send(message);
       } else {
         this.ws.send(JSON.stringify(message));
@@ -147,7 +160,7 @@ class WebSocketService {
   startHeartbeat() {
     this.heartbeatInterval = setInterval(() => {
       if (this.ws?.readyState === WebSocket.OPEN) {
-        this.send('ping');
+        this.send(PING_FRAME);
       }
     }, 30000); // Every 30 seconds
   }